@@ -0,0 +1,115 @@
+"""
+Wall time and peak memory of ``make_centered_gp_eigendecomp`` on long time grids.
+
+The decomposition builds the covariance in a single buffer and only computes
+its leading eigenpairs. It is compared with the full decomposition it
+replaced, which kept one distance matrix per lengthscale and decomposed the
+whole matrix, on the grids small enough for it, and the bases are checked to
+give the same covariance. Peak memory is measured with ``tracemalloc``.
+
+    python benchmarks/gp_eigendecomp.py --sizes 1000 2000 5000 10000 20000
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+from scipy import linalg
+from utils.gpapproximation import make_centered_gp_eigendecomp, make_sum_zero_hh
+
+
+def full_eigendecomp(
+    time: np.ndarray,
+    lengthscale: List[float],
+    variance_limit: float,
+    zerosum: bool = False,
+) -> np.ndarray:
+    """The gaussian basis as computed before, from the full decomposition."""
+    X = time[:, None]
+    dists = [((X - X.T) / ls) ** 2 for ls in lengthscale]
+    cov = sum(np.exp(-dist / 2) for dist in dists) / len(lengthscale)
+    if zerosum:
+        Q = make_sum_zero_hh(len(cov))
+        D = np.eye(len(cov))
+        D[0, 0] = 0
+        cov = Q.T @ D @ Q @ cov @ Q.T @ D @ Q
+
+    vals, vecs = linalg.eigh(cov)
+    vals, vecs = vals[vals > 0], vecs[:, vals > 0]
+    n_eigs = ((vals[::-1].cumsum() / vals.sum()) > variance_limit).nonzero()[0][0]
+    return vecs[:, -n_eigs:] * np.sqrt(vals[-n_eigs:])
+
+
+def measured(compute: Callable[[], np.ndarray]):
+    """The result of ``compute``, its wall time and its peak memory in MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = compute()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000])
+    parser.add_argument("--lengthscales", type=float, nargs="+", default=[5, 14, 28])
+    parser.add_argument("--variance-limit", type=float, default=0.95)
+    parser.add_argument("--zerosum", action="store_true")
+    parser.add_argument(
+        "--reference-max",
+        type=int,
+        default=5000,
+        help="Largest grid on which the full decomposition is run.",
+    )
+    args = parser.parse_args()
+
+    rows = {}
+    for n in args.sizes:
+        grid = np.arange(n, dtype=float)
+        reference = None
+        if n <= args.reference_max:
+            reference, seconds, peak = measured(
+                lambda: full_eigendecomp(
+                    grid, args.lengthscales, args.variance_limit, args.zerosum
+                )
+            )
+            rows[(n, "full")] = {
+                "seconds": seconds,
+                "peak_mb": peak,
+                "n_basis": reference.shape[1],
+            }
+
+        for dtype in ("float64", "float32"):
+            basis, seconds, peak = measured(
+                lambda: make_centered_gp_eigendecomp(
+                    grid,
+                    lengthscale=args.lengthscales,
+                    variance_limit=args.variance_limit,
+                    zerosum=args.zerosum,
+                    dtype=dtype,
+                )
+            )
+            rows[(n, dtype)] = {
+                "seconds": seconds,
+                "peak_mb": peak,
+                "n_basis": basis.shape[1],
+            }
+            if reference is not None:
+                # up to the signs of the eigenvectors
+                rows[(n, dtype)]["max_cov_error"] = np.abs(
+                    basis @ basis.T - reference @ reference.T
+                ).max()
+
+    print(
+        pd.DataFrame(rows)
+        .T.rename_axis(["n", "method"])
+        .to_string(float_format="{:.3g}".format)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Wall time and calibration of ``fit_vi`` against ``sample_all`` on the 2022 election.
+
+The polls of the last ``--test-days`` of the campaign are held out, and
+compared with the forecast of ``forecast_election`` at their dates: the
+absolute error of the posterior mean of ``noisy_popularity``, and the coverage
+of its central credible intervals across polls and parties.
+
+    python benchmarks/vi_vs_nuts.py --test-days 60 --batch-size 256
+"""
+import argparse
+import time
+from typing import Callable, Dict
+
+import arviz
+import numpy as np
+import pandas as pd
+from utils.model import PresidentialElectionsModel
+
+VAR_NAMES = ["N_approve", "R"]
+
+
+def calibration(
+    model: PresidentialElectionsModel,
+    idata: arviz.InferenceData,
+    probs=(0.5, 0.9),
+) -> Dict[str, float]:
+    polls = model.polls_test
+    observed = (
+        polls[model.political_families].to_numpy(dtype=float)
+        / polls["samplesize"].to_numpy()[:, None]
+    )
+    forecast = model.forecast_election(idata).predictions["noisy_popularity"]
+    draws = (
+        forecast.sel(observations=pd.DatetimeIndex(polls["date"]))
+        .stack(sample=("chain", "draw"))
+        .transpose("sample", "observations", "parties_complete")
+        .to_numpy()
+    )
+
+    scores = {"mae": float(np.abs(draws.mean(0) - observed).mean())}
+    for prob in probs:
+        low, high = np.quantile(draws, [(1 - prob) / 2, (1 + prob) / 2], axis=0)
+        scores[f"coverage_{prob:.0%}"] = float(
+            np.mean((low <= observed) & (observed <= high))
+        )
+    return scores
+
+
+def timed(fit: Callable[[], arviz.InferenceData]):
+    start = time.perf_counter()
+    idata = fit()
+    return idata, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--test-days", type=int, default=60)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=30_000)
+    parser.add_argument("--draws", type=int, default=1000)
+    parser.add_argument("--chains", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=2022)
+    args = parser.parse_args()
+
+    model = PresidentialElectionsModel(
+        election_date="2022-04-10", test_cutoff=pd.Timedelta(args.test_days, "D")
+    )
+    fits = {
+        "nuts": lambda: model.sample_all(
+            var_names=VAR_NAMES,
+            draws=args.draws,
+            chains=args.chains,
+            random_seed=args.seed,
+        ),
+    }
+    for method in ("advi", "fullrank_advi"):
+        for batch_size in (None, args.batch_size):
+            fits[f"{method}[batch_size={batch_size}]"] = (
+                lambda method=method, batch_size=batch_size: model.fit_vi(
+                    var_names=VAR_NAMES,
+                    method=method,
+                    batch_size=batch_size,
+                    n=args.steps,
+                    draws=args.draws,
+                    random_seed=args.seed,
+                )
+            )
+
+    rows = {}
+    for name, fit in fits.items():
+        idata, seconds = timed(fit)
+        rows[name] = {"seconds": seconds} | calibration(model, idata)
+    print(pd.DataFrame(rows).T.to_string(float_format="{:.3f}".format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from utils.datasources import DataCache, _atomic_write
+
+# the latency of each path, in seconds
+LATENCIES = {"/a.csv": 0.6, "/b.csv": 0.4, "/c.csv": 0.2}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = Counter()
+    failures = {}
+
+    def do_GET(self):
+        self.hits[self.path] += 1
+        time.sleep(LATENCIES.get(self.path, 0))
+        if self.failures.get(self.path, 0) > 0:
+            self.failures[self.path] -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"content of {self.path}".encode()
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.hits.clear()
+    _Handler.failures.clear()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_prefetch_waits_for_the_slowest_source(tmp_path, server):
+    cache = DataCache(cache_dir=tmp_path, data_url=server)
+
+    start = time.perf_counter()
+    cache.prefetch(path[1:] for path in LATENCIES)
+    elapsed = time.perf_counter() - start
+
+    assert max(LATENCIES.values()) <= elapsed < 0.8 * sum(LATENCIES.values())
+    for path in LATENCIES:
+        assert cache.fetch(path[1:]) == f"content of {path}".encode()
+    # served from the prefetched content
+    assert all(_Handler.hits[path] == 1 for path in LATENCIES)
+
+
+def test_server_errors_are_retried_with_backoff(tmp_path, server):
+    _Handler.failures["/flaky.csv"] = 2
+    cache = DataCache(cache_dir=tmp_path, data_url=server, retries=2, backoff=0.1)
+
+    start = time.perf_counter()
+    content = cache.fetch("flaky.csv")
+    elapsed = time.perf_counter() - start
+
+    assert content == b"content of /flaky.csv"
+    assert _Handler.hits["/flaky.csv"] == 3
+    # 0.1s then 0.2s before the retries
+    assert elapsed >= 0.3
+
+
+def test_server_errors_are_raised_after_the_last_retry(tmp_path, server):
+    _Handler.failures["/flaky.csv"] = 3
+    cache = DataCache(cache_dir=tmp_path, data_url=server, retries=1, backoff=0.01)
+
+    with pytest.raises(Exception, match="503"):
+        cache.fetch("flaky.csv")
+    assert _Handler.hits["/flaky.csv"] == 2
+
+
+def test_not_modified_serves_the_cached_copy(tmp_path, server):
+    cache = DataCache(cache_dir=tmp_path, data_url=server, ttl=0)
+    content = cache.fetch("d.csv")
+    (entry,) = (tmp_path / "index").iterdir()
+    before = entry.read_text()
+
+    assert cache.fetch("d.csv") == content
+    assert _Handler.hits["/d.csv"] == 2
+    # revalidated: the entry is fresh again
+    assert entry.read_text() != before
+
+
+def test_failed_revalidation_serves_the_cached_copy(tmp_path, server):
+    cache = DataCache(cache_dir=tmp_path, data_url=server, ttl=0, backoff=0.01)
+    content = cache.fetch("d.csv")
+    _Handler.failures["/d.csv"] = 3
+
+    with pytest.warns(UserWarning, match="serving cached copy"):
+        assert cache.fetch("d.csv") == content
+
+
+def test_concurrent_writes_of_the_same_file(tmp_path):
+    path = tmp_path / "entry"
+    contents = [bytes([i]) * 100_000 for i in range(8)]
+
+    def write(content):
+        for _ in range(20):
+            _atomic_write(path, content)
+
+    with ThreadPoolExecutor(len(contents)) as executor:
+        # raises the errors of the threads, if any
+        list(executor.map(write, contents))
+
+    assert path.read_bytes() in contents
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy.special import gammaln
+from utils.dirichletmultinomial import _DirichletMultinomialLogp, competing_mask
+
+# the node only gives the dtype of the outputs to ``perform``
+NODE = SimpleNamespace(outputs=[SimpleNamespace(dtype="float64")] * 3)
+
+
+def _data():
+    rng = np.random.default_rng(0)
+    mask = np.ones((6, 4), dtype=bool)
+    # a party missing from some polls, and a row without any party
+    mask[[1, 2], 3] = False
+    mask[4] = False
+    mask = competing_mask(mask)
+    counts = rng.integers(0, 50, size=mask.shape) * mask
+    counts[0, 1] = 0
+    # a count outside of the mask
+    counts[2, 3] = 7
+    return counts, counts.sum(axis=-1), mask
+
+
+def _reference_logp(logits, concentration, counts, n, mask):
+    """The log-densities of each row, summed over all the parties of its mask."""
+    concentration = np.broadcast_to(concentration, n.shape)
+    logp = np.empty(len(n))
+    for i, (x, c, m) in enumerate(zip(counts, concentration, mask)):
+        if x[~m].any():
+            logp[i] = -np.inf
+            continue
+        p = np.exp(logits[i, m]) / np.exp(logits[i, m]).sum()
+        a = c * p
+        logp[i] = (
+            gammaln(n[i] + 1)
+            - gammaln(x + 1).sum()
+            + gammaln(c)
+            - gammaln(n[i] + c)
+            + (gammaln(x[m] + a) - gammaln(a)).sum()
+        )
+    return logp
+
+
+def _perform(op, *inputs):
+    outputs = [[None] for _ in range(3)]
+    # the gradients are not finite on the rows with counts outside of the mask
+    with np.errstate(invalid="ignore"):
+        op.perform(NODE, inputs, outputs)
+    return [output[0] for output in outputs]
+
+
+@pytest.mark.filterwarnings("ignore:invalid value:RuntimeWarning")
+@pytest.mark.parametrize("per_row", [False, True], ids=["scalar", "per_row"])
+def test_logp_and_gradients(per_row):
+    counts, n, mask = _data()
+    rng = np.random.default_rng(1)
+    logits = rng.normal(size=counts.shape)
+    concentration = rng.uniform(5, 50, size=len(n)) if per_row else np.array(20.0)
+    valid = ~(counts * ~mask).any(axis=-1)
+
+    logp, dlogits, dconcentration = _perform(
+        _DirichletMultinomialLogp(), logits, concentration, counts, n, mask
+    )
+
+    expected = _reference_logp(logits, concentration, counts, n, mask)
+    np.testing.assert_allclose(logp, expected, rtol=1e-10)
+    assert np.isneginf(logp[~valid]).all()
+
+    eps = 1e-6
+    for k in range(counts.shape[1]):
+        step = np.zeros_like(logits)
+        step[:, k] = eps
+        expected = (
+            _reference_logp(logits + step, concentration, counts, n, mask)
+            - _reference_logp(logits - step, concentration, counts, n, mask)
+        ) / (2 * eps)
+        np.testing.assert_allclose(
+            dlogits[valid, k], expected[valid], rtol=1e-5, atol=1e-6
+        )
+    # the logits of the parties out of the mask have no effect
+    np.testing.assert_array_equal(dlogits[~mask & valid[:, None]], 0)
+
+    c = np.broadcast_to(concentration, n.shape)
+    expected = (
+        _reference_logp(logits, c + eps, counts, n, mask)
+        - _reference_logp(logits, c - eps, counts, n, mask)
+    ) / (2 * eps)
+    np.testing.assert_allclose(
+        dconcentration[valid], expected[valid], rtol=1e-5, atol=1e-6
+    )
+
+
+@pytest.mark.parametrize("cache_data", [True, False])
+def test_data_changed_in_place(cache_data):
+    counts, n, mask = _data()
+    logits = np.random.default_rng(2).normal(size=counts.shape)
+    op = _DirichletMultinomialLogp(cache_data=cache_data)
+    _perform(op, logits, np.array(20.0), counts, n, mask)
+
+    # the same buffers, refilled with other data
+    counts[1, 3] = 5
+    n[1] += 5
+    logp, _, _ = _perform(op, logits, np.array(20.0), counts, n, mask)
+
+    np.testing.assert_allclose(
+        logp, _reference_logp(logits, np.array(20.0), counts, n, mask), rtol=1e-10
+    )
+    assert np.isneginf(logp[1])
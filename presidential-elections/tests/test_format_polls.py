@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.model import PresidentialElectionsModel, dates_to_idx
+
+PARTIES = PresidentialElectionsModel.political_families
+
+
+def _format_polls_reference(polls, parties_complete):
+    """The polls of ``_format_polls`` before it was vectorized, without the
+    results, which are read from the results source."""
+    dfs = []
+    for date in polls.dateelection.unique():
+        date = pd.to_datetime(date)
+        df = polls[
+            (polls.dateelection == date) & (polls.date >= f"{date.year}-01")
+        ].copy()
+        df["countdown"] = dates_to_idx(df["date"], reference_date=date).astype(int)
+        dfs.append(df)
+
+    polls = (
+        pd.concat(dfs)
+        .set_index(["dateelection", "date", "countdown", "sondage", "samplesize"])
+        .rename(
+            columns={col: col.split("nb")[1] for col in polls if col.startswith("nb")}
+        )[parties_complete[:-1]]
+    )
+    polls["other"] = 100 - polls.sum(1)
+
+    polls = polls.reset_index()
+    results_raw = polls[polls.sondage == "result"]
+    polls = polls[polls.sondage != "result"].set_index(["date", "sondage"])
+
+    polls[parties_complete] = (
+        (polls[parties_complete] / 100)
+        .mul(polls["samplesize"], axis=0)
+        .round()
+        .fillna(0)
+        .astype(int)
+    )
+    polls["samplesize"] = polls[parties_complete].sum(1)
+
+    return results_raw, polls.reset_index()
+
+
+@pytest.fixture
+def polls():
+    rng = np.random.default_rng(0)
+    n = 40
+    election = np.where(np.arange(n) < 20, "2017-04-23", "2022-04-10")
+    # some of the polls are before Jan 1st of the election year
+    date = pd.to_datetime(election) - pd.to_timedelta(
+        rng.integers(1, 200, size=n), "D"
+    )
+    shares = rng.dirichlet(np.ones(len(PARTIES)), size=n) * 100
+    polls = pd.DataFrame(
+        {
+            "date": date,
+            "sondage": rng.choice(["Ifop", "Elabe", "BVA"], size=n),
+            "samplesize": rng.integers(800, 2000, size=n).astype(float),
+            "dateelection": pd.to_datetime(election),
+        }
+        | {f"nb{party}": share for party, share in zip(PARTIES, shares.T)}
+    )
+    # no green candidate in some polls, missing in others
+    polls.loc[:4, "nbgreen"] = 0
+    polls.loc[30:, "nbsouverainistes"] = np.nan
+    # "nbother" is recomputed from the other shares
+    polls["nbother"] = 99.0
+    # the results, the last one not known yet
+    results = polls.iloc[[0, 20]].copy()
+    results["date"] = results["dateelection"]
+    results["sondage"] = "result"
+    results["samplesize"] = [35_000_000.0, np.nan]
+    results.loc[results.index[1], [f"nb{party}" for party in PARTIES]] = np.nan
+    return (
+        pd.concat([polls, results])
+        .sort_values(["dateelection", "date", "sondage", "samplesize"])
+        .reset_index(drop=True)
+    )
+
+
+def test_format_poll_rows_matches_reference(polls):
+    model = PresidentialElectionsModel.__new__(PresidentialElectionsModel)
+
+    expected_results, expected = _format_polls_reference(polls.copy(), PARTIES)
+    results, formatted = model._format_poll_rows(polls.copy(), PARTIES)
+
+    assert list(formatted.columns) == [
+        "date",
+        "sondage",
+        "dateelection",
+        "countdown",
+        "samplesize",
+    ] + PARTIES
+    pd.testing.assert_frame_equal(formatted, expected)
+    pd.testing.assert_frame_equal(
+        results.reset_index(drop=True), expected_results.reset_index(drop=True)
+    )
+    assert len(formatted) < (polls["sondage"] != "result").sum()
+    assert (formatted["date"].dt.year == formatted["dateelection"].dt.year).all()
+
+
+def test_format_poll_rows_other_share():
+    polls = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2022-03-01", "2022-03-02"]),
+            "sondage": ["Ifop", "Elabe"],
+            "samplesize": [1000.0, 2000.0],
+            "dateelection": pd.to_datetime(["2022-04-10", "2022-04-10"]),
+        }
+        | {f"nb{party}": [10.0, 12.5] for party in PARTIES[:-2]}
+        | {"nbsouverainistes": [np.nan, 10.0], "nbother": [0.0, 0.0]}
+    )
+    model = PresidentialElectionsModel.__new__(PresidentialElectionsModel)
+
+    _, formatted = model._format_poll_rows(polls, PARTIES)
+
+    np.testing.assert_array_equal(formatted["countdown"], [40, 39])
+    np.testing.assert_array_equal(formatted["other"], [400, 300])
+    np.testing.assert_array_equal(formatted["souverainistes"], [0, 200])
+    np.testing.assert_array_equal(formatted["samplesize"], [1000, 2000])
+    assert formatted["other"].dtype == int
+    assert formatted["samplesize"].dtype == int
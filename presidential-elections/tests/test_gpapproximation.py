@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from scipy import linalg
+from utils.gpapproximation import (
+    RandomWalkBasis,
+    _project_zerosum,
+    apply_gp_basis_at,
+    make_centered_gp_eigendecomp,
+    make_sum_zero_hh,
+)
+
+TIME = np.arange(0, 120, 1.5)
+# number of polls at each time point
+POLL_WEIGHTS = np.random.default_rng(0).integers(1, 6, size=len(TIME))
+
+
+def _householder_projection(cov, a=None):
+    """The zero-sum projection as computed before, with a householder matrix."""
+    Q = make_sum_zero_hh(len(cov), a)
+    D = np.eye(len(cov))
+    D[0, 0] = 0
+    return Q.T @ D @ Q @ cov @ Q.T @ D @ Q
+
+
+def _gaussian_cov(time, lengthscales=(5, 14, 28)):
+    lags = time[:, None] - time[None, :]
+    return sum(np.exp(-((lags / ls) ** 2) / 2) for ls in lengthscales) / len(
+        lengthscales
+    )
+
+
+@pytest.mark.parametrize("a", [None, POLL_WEIGHTS], ids=["unweighted", "weighted"])
+def test_project_zerosum_matches_householder(a):
+    cov = _gaussian_cov(TIME)
+    expected = _householder_projection(cov, a)
+
+    projected = _project_zerosum(cov.copy(), a)
+
+    np.testing.assert_allclose(projected, expected, atol=1e-12)
+    np.testing.assert_allclose(projected, projected.T, atol=1e-12)
+
+
+@pytest.mark.parametrize("a", [None, POLL_WEIGHTS], ids=["unweighted", "weighted"])
+def test_zerosum_basis(a):
+    expected_vals = linalg.eigvalsh(_householder_projection(_gaussian_cov(TIME), a))
+
+    basis = make_centered_gp_eigendecomp(
+        TIME, lengthscale=[5, 14, 28], variance_limit=0.95, zerosum=True, a=a
+    )
+
+    weights = np.ones(len(TIME)) if a is None else a
+    np.testing.assert_allclose(weights @ basis, 0, atol=1e-10)
+    # the columns are the eigenvectors scaled by the root of their eigenvalue
+    vals = np.sum(basis**2, axis=0)
+    np.testing.assert_allclose(vals, expected_vals[-basis.shape[1] :], rtol=1e-10)
+
+
+RANDOM_WALK_CASES = {
+    "plain": {"zerosum": False, "a": None},
+    "zerosum": {"zerosum": True, "a": None},
+    "weighted": {"zerosum": True, "a": POLL_WEIGHTS},
+}
+
+
+@pytest.mark.parametrize("config", RANDOM_WALK_CASES.values(), ids=RANDOM_WALK_CASES)
+def test_random_walk_covariance(config):
+    cov = np.minimum(TIME[:, None], TIME[None, :])
+    if config["zerosum"]:
+        cov = _householder_projection(cov, config["a"])
+    dense = make_centered_gp_eigendecomp(
+        TIME, kernel="randomwalk", variance_limit=1, **config
+    )
+
+    basis = RandomWalkBasis(TIME, **config).toarray()
+
+    np.testing.assert_allclose(basis @ basis.T, cov, atol=1e-9)
+    np.testing.assert_allclose(basis @ basis.T, dense @ dense.T, atol=1e-9)
+
+
+@pytest.mark.parametrize("config", RANDOM_WALK_CASES.values(), ids=RANDOM_WALK_CASES)
+@pytest.mark.parametrize("shape", [(), (3,), (3, 4)])
+def test_random_walk_dot(config, shape):
+    basis = RandomWalkBasis(TIME, **config)
+    coefs = np.random.default_rng(1).normal(size=(len(TIME),) + shape)
+
+    walk = basis.dot(coefs)
+
+    np.testing.assert_allclose(
+        walk, np.tensordot(basis.toarray(), coefs, axes=(1, 0)), atol=1e-9
+    )
+    if config["zerosum"]:
+        weights = np.ones(len(TIME)) if config["a"] is None else config["a"]
+        np.testing.assert_allclose(
+            np.tensordot(weights, walk, axes=(0, 0)), 0, atol=1e-9
+        )
+
+
+@pytest.mark.parametrize("kind", ["dense", "randomwalk"])
+def test_apply_gp_basis_at(kind):
+    rng = np.random.default_rng(2)
+    if kind == "dense":
+        basis = make_centered_gp_eigendecomp(TIME, lengthscale=14)
+        full_basis = basis
+    else:
+        basis = RandomWalkBasis(TIME, zerosum=True)
+        full_basis = basis.toarray()
+    coefs = rng.normal(size=(full_basis.shape[1], 8, 3))
+    rows = rng.integers(0, len(TIME), size=50)
+    batch = rng.integers(0, 3, size=50)
+
+    values = apply_gp_basis_at(basis, coefs, rows, batch)
+
+    expected = np.tensordot(full_basis, coefs, axes=(1, 0))[rows, :, batch]
+    np.testing.assert_allclose(values, expected, atol=1e-9)
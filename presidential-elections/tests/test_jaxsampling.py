@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from utils.dirichletmultinomial import _DirichletMultinomialLogp, competing_mask
+from utils.jaxsampling import dirichlet_multinomial_logp
+
+jax = pytest.importorskip("jax")
+
+# the node only gives the dtype of the outputs to ``perform``
+NODE = SimpleNamespace(outputs=[SimpleNamespace(dtype="float64")] * 3)
+
+
+@pytest.mark.parametrize("per_row", [False, True], ids=["scalar", "per_row"])
+def test_dirichlet_multinomial_logp_matches_perform(per_row):
+    rng = np.random.default_rng(0)
+    mask = np.ones((6, 4), dtype=bool)
+    # a party missing from some polls, and a row without any party
+    mask[[1, 2], 3] = False
+    mask[4] = False
+    mask = competing_mask(mask)
+    counts = rng.integers(0, 50, size=mask.shape) * mask
+    counts[0, 1] = 0
+    # a count outside of the mask
+    counts[2, 3] = 7
+    n = counts.sum(axis=-1)
+    logits = rng.normal(size=counts.shape).astype(np.float32)
+    concentration = (
+        rng.uniform(5, 50, size=len(n)) if per_row else np.array(20.0)
+    ).astype(np.float32)
+    inputs = (logits, concentration, counts, n, mask)
+    valid = ~(counts * ~mask).any(axis=-1)
+
+    expected = [[None] for _ in range(3)]
+    with np.errstate(invalid="ignore"):
+        _DirichletMultinomialLogp().perform(NODE, inputs, expected)
+    logp, dlogits, dconcentration = (
+        np.asarray(output) for output in dirichlet_multinomial_logp(*inputs)
+    )
+
+    np.testing.assert_allclose(logp, expected[0][0], rtol=1e-5)
+    np.testing.assert_allclose(
+        dlogits[valid], expected[1][0][valid], rtol=1e-4, atol=1e-4
+    )
+    np.testing.assert_allclose(
+        dconcentration[valid], expected[2][0][valid], rtol=1e-4, atol=1e-5
+    )
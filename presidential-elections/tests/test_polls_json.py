@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from utils.model import PresidentialElectionsModel
+from utils.snapshot import load_snapshot, save_snapshot
+
+RAW_POLLS = {
+    "sondages": {
+        "ifop-1": {
+            "institut": "Ifop",
+            "date_debut": "2022-01-03",
+            "date_fin": "2022-01-05",
+            "premier_tour": [
+                {
+                    "hypothese": "Sans Taubira",
+                    "intentions_exprimees": 1200,
+                    "intentions": {"Emmanuel Macron": 25.0, "Marine Le Pen": 17.0},
+                },
+                {
+                    "intentions_exprimees": 1180,
+                    "intentions": {
+                        "Emmanuel Macron": 24.0,
+                        "Christiane Taubira": 4.0,
+                    },
+                },
+            ],
+        },
+        "elabe-1": {
+            "institut": "Elabe",
+            "date_debut": "2022-01-10",
+            "date_fin": "2022-01-11",
+            "premier_tour": [
+                {
+                    "hypothese": None,
+                    "intentions": {"Marine Le Pen": 18.0, "Yannick Jadot": 5.0},
+                },
+            ],
+        },
+    }
+}
+
+
+def test_flatten_polls_json_with_missing_fields():
+    hypotheses = PresidentialElectionsModel._flatten_polls_json(RAW_POLLS)
+
+    assert list(hypotheses.index) == [("ifop-1", 0), ("ifop-1", 1), ("elabe-1", 0)]
+    assert hypotheses["hypothese"].tolist() == ["Sans Taubira", "", ""]
+    np.testing.assert_array_equal(
+        hypotheses["intentions_exprimees"], [1200.0, 1180.0, np.nan]
+    )
+    assert hypotheses["intentions_exprimees"].dtype == np.float64
+    assert hypotheses.loc[("elabe-1", 0), "Marine Le Pen"] == 18.0
+    assert np.isnan(hypotheses.loc[("elabe-1", 0), "Emmanuel Macron"])
+
+
+def test_flattened_polls_can_be_snapshotted(tmp_path):
+    hypotheses = PresidentialElectionsModel._flatten_polls_json(RAW_POLLS)
+
+    save_snapshot(tmp_path / "snap", {"hypotheses_2022": hypotheses})
+    loaded, _ = load_snapshot(tmp_path / "snap")
+
+    pd.testing.assert_frame_equal(loaded["hypotheses_2022"], hypotheses)
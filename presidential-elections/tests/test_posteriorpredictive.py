@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from utils import deterministics, dirichletmultinomial, posteriorpredictive
+from utils.model import PresidentialElectionsModel
+
+N_CHAINS, N_DRAWS, N_ROWS, N_PARTIES = 2, 10, 5, 4
+
+
+class _Tensor:
+    def __init__(self, value):
+        self.value = value
+
+    def eval(self):
+        return self.value
+
+
+class _FakeDistribution:
+    def __init__(self):
+        self.logits = "logits"
+        self.concentration = "concentration"
+        self.n = _Tensor(np.full(N_ROWS, 1000))
+        mask = np.ones((N_ROWS, N_PARTIES), dtype=bool)
+        mask[0, -1] = False
+        self.mask = _Tensor(mask)
+
+
+class _FakeModel:
+    observed_RVs = [SimpleNamespace(name="N_approve", distribution=_FakeDistribution())]
+    free_RVs = [SimpleNamespace(name="mu")]
+
+    def __getitem__(self, name):
+        return name
+
+
+def _iter_draws(fn, posterior, names, chunk_draws):
+    rng = np.random.default_rng(0)
+    for chain in range(N_CHAINS):
+        for start in range(0, N_DRAWS, chunk_draws):
+            draws = slice(start, min(start + chunk_draws, N_DRAWS))
+            size = draws.stop - draws.start
+            yield chain, draws, [
+                rng.normal(size=(size, N_ROWS, N_PARTIES)),
+                rng.gamma(100, 10, size=size),
+            ]
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    # in the namespace of the module, whose ``__getattr__`` would define the
+    # real class
+    monkeypatch.setitem(
+        vars(dirichletmultinomial), "SoftmaxDirichletMultinomial", _FakeDistribution
+    )
+    monkeypatch.setattr(deterministics, "draws_function", lambda inputs, outputs: None)
+    monkeypatch.setattr(deterministics, "iter_draws", _iter_draws)
+    monkeypatch.setattr(
+        posteriorpredictive,
+        "pm",
+        SimpleNamespace(util=SimpleNamespace(is_transformed_name=lambda name: False)),
+    )
+    return _FakeModel()
+
+
+def _draw(model, random_seed, processes):
+    return posteriorpredictive.sample_posterior_predictive(
+        model,
+        SimpleNamespace(sizes={"chain": N_CHAINS, "draw": N_DRAWS}),
+        ["N_approve"],
+        random_seed=random_seed,
+        chunk_draws=3,
+        processes=processes,
+    )["N_approve"]
+
+
+def test_draws_do_not_depend_on_the_processes(fake_model):
+    counts = _draw(fake_model, random_seed=1, processes=None)
+
+    assert counts.shape == (N_CHAINS, N_DRAWS, N_ROWS, N_PARTIES)
+    np.testing.assert_array_equal(counts.sum(-1), 1000)
+    # the party out of the poll gets no count
+    assert not counts[:, :, 0, -1].any()
+    for processes in (1, 3):
+        np.testing.assert_array_equal(
+            _draw(fake_model, random_seed=1, processes=processes), counts
+        )
+    assert (_draw(fake_model, random_seed=2, processes=None) != counts).any()
+
+
+def test_forecast_polls_depend_on_the_seed():
+    xr = pytest.importorskip("xarray")
+
+    model = PresidentialElectionsModel.__new__(PresidentialElectionsModel)
+    model.unique_elections = pd.to_datetime(["2017-04-23", "2022-04-10"])
+    model.unique_pollsters = pd.Index(["Ifop", "Elabe", "BVA"])
+    model.results_oos = pd.DataFrame({"samplesize": [1000, 1500, 2000]})
+    idata = SimpleNamespace(
+        posterior=xr.Dataset(
+            coords={
+                "countdown": np.arange(30),
+                "elections": model.unique_elections,
+            }
+        )
+    )
+
+    _, polls = model._generate_oos_data(idata, random_seed=1)
+
+    pd.testing.assert_frame_equal(model._generate_oos_data(idata, 1)[1], polls)
+    assert not polls.equals(model._generate_oos_data(idata, 2)[1])
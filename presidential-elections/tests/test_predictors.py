@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from utils.model import PresidentialElectionsModel
+
+
+def test_combine_predictors_ends_each_predictor():
+    quarterly = pd.DataFrame(
+        {"unemployment": [7.0, 8.0, 9.0, 10.0]},
+        index=pd.period_range("2021Q1", periods=4, freq="Q"),
+    )
+    monthly = pd.DataFrame(
+        {"inflation": [1.0, 2.0]},
+        index=pd.period_range("2021-01", periods=2, freq="M"),
+    )
+
+    combined = PresidentialElectionsModel._combine_predictors([quarterly, monthly])
+
+    assert list(combined.index) == list(
+        pd.to_datetime(
+            [
+                "2021-01-01",
+                "2021-02-01",
+                "2021-03-01",
+                "2021-04-01",
+                "2021-07-01",
+                "2021-10-01",
+                "2022-01-01",
+            ]
+        )
+    )
+    np.testing.assert_array_equal(
+        combined["unemployment"], [7.0, 7.0, 7.0, 8.0, 9.0, 10.0, np.nan]
+    )
+    # missing after the end of its last month, not only after the last quarter
+    np.testing.assert_array_equal(
+        combined["inflation"], [1.0, 2.0, np.nan, np.nan, np.nan, np.nan, np.nan]
+    )
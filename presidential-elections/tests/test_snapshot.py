@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.snapshot import load_snapshot, save_snapshot
+
+
+@pytest.fixture
+def frames():
+    dates = pd.date_range("2022-01-01", periods=6, freq="D")
+    polls = pd.DataFrame(
+        {
+            "sondage": pd.Categorical(["ifop", "elabe", "ifop", "bva", "bva", "elabe"]),
+            "samplesize": np.arange(1000, 1006, dtype=np.int64),
+            "share": np.linspace(0.1, 0.6, 6),
+            "period": pd.period_range("2022-01", periods=6, freq="M"),
+            "comment": ["a", "b", "c", "d", "e", "f"],
+        },
+        index=pd.Index(dates, name="date"),
+    )
+    multi = polls.set_index("sondage", append=True)
+    return {
+        "polls": polls,
+        "multi": multi,
+        "unnamed": polls.reset_index(drop=True),
+        "pollsters": pd.Index(["bva", "elabe", "ifop"], name="sondage"),
+    }
+
+
+def test_round_trip(tmp_path, frames):
+    save_snapshot(tmp_path / "snap", frames, attrs={"election_date": "2022-04-10"})
+    loaded, attrs = load_snapshot(tmp_path / "snap")
+
+    assert attrs == {"election_date": "2022-04-10"}
+    for name in ("polls", "multi", "unnamed"):
+        pd.testing.assert_frame_equal(
+            loaded[name], frames[name], check_freq=False, check_index_type=False
+        )
+    pd.testing.assert_index_equal(loaded["pollsters"], frames["pollsters"])
+
+
+def test_numeric_columns_stay_memory_mapped(tmp_path, frames):
+    save_snapshot(tmp_path / "snap", frames)
+    loaded, _ = load_snapshot(tmp_path / "snap")
+
+    for name in ("polls", "multi"):
+        for column in ("samplesize", "share"):
+            values = loaded[name][column].to_numpy()
+            assert isinstance(values.base, np.memmap) or isinstance(
+                values, np.memmap
+            ), f"{name}.{column} was copied out of its memory map"
+
+    loaded, _ = load_snapshot(tmp_path / "snap", mmap=False)
+    assert not isinstance(loaded["polls"]["share"].to_numpy(), np.memmap)
@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from utils.warmstart import _on_model_coords, _variance_fill
+
+
+def test_variance_fill_sets_the_added_values():
+    variance = np.array([1.0, 2.0, 3.0, 0.5, 9.0])
+    added = np.array([False, False, True, False, True])
+
+    filled = _variance_fill(variance, added, sizes=[3, 2])
+
+    np.testing.assert_array_equal(filled, [1.0, 2.0, 1.5, 0.5, 0.5])
+
+
+def test_on_model_coords_records_the_added_labels():
+    xr = pytest.importorskip("xarray")
+    values = xr.DataArray(
+        np.arange(12, dtype=float).reshape(2, 3, 2),
+        dims=("chain", "draw", "pollsters"),
+        coords={"pollsters": ["bva", "ifop"]},
+    )
+    model = SimpleNamespace(
+        RV_dims={"house_effects": ("pollsters",)},
+        coords={"pollsters": ["bva", "elabe", "ifop"]},
+    )
+
+    draws, added = _on_model_coords(values, model, "house_effects")
+
+    np.testing.assert_array_equal(added, [False, True, False])
+    np.testing.assert_array_equal(draws[..., [0, 2]], values.to_numpy())
+    np.testing.assert_array_equal(draws[..., 1], values.mean("pollsters").to_numpy())
@@ -0,0 +1,61 @@
+import importlib
+import types
+from typing import Callable, Optional
+
+"""
+Deferred imports of the heavy dependencies (the PPL stack, pandas, plotting
+libraries), so that importing ``utils`` stays cheap for tools that never build
+or sample a model.
+"""
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module, which is only imported on first attribute access.
+
+    Parameters
+    ----------
+    name
+        Name of the module to import.
+    loader
+        Function returning the module, for when which module to import is
+        only known at import time. Defaults to importing ``name``.
+    """
+
+    def __init__(
+        self, name: str, loader: Optional[Callable[[], types.ModuleType]] = None
+    ):
+        super().__init__(name)
+        self._loader = loader
+        self._module = None
+
+    def _load(self) -> types.ModuleType:
+        if self._module is None:
+            if self._loader is None:
+                self._module = importlib.import_module(self.__name__)
+            else:
+                self._module = self._loader()
+        return self._module
+
+    def __getattr__(self, attr: str):
+        # only called for attributes that are not set on the stand-in itself
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def tensor_module() -> types.ModuleType:
+    """The tensor module of the backend PyMC3 runs on."""
+    import pymc3 as pm
+
+    # Aesara will replace Theano in PyMC 4.0
+    if pm.math.erf.__module__.split(".")[0] == "theano":
+        return importlib.import_module("theano.tensor")
+    return importlib.import_module("aesara.tensor")
+
+
+def backend_module() -> types.ModuleType:
+    """The backend PyMC3 runs on, Theano or Aesara."""
+    import pymc3 as pm
+
+    return importlib.import_module(pm.math.erf.__module__.split(".")[0])
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, url2pathname, urlopen
+
+"""
+Local, content-addressed cache for the remote data sources used by the models.
+
+Every remote file is stored once under ``objects/`` by the SHA-256 of its
+content, and an index entry per URL records which object it currently points
+to, together with the ``ETag`` and ``Last-Modified`` headers sent by the server.
+Entries younger than ``ttl`` are served without touching the network; older
+ones are revalidated with a conditional request, so that an unchanged upstream
+file only costs a ``304 Not Modified``.
+
+The cache is configured with arguments or with the following environment
+variables:
+
+- ``POLLSPOSITION_CACHE_DIR``: where the cache lives (``~/.cache/pollsposition``).
+- ``POLLSPOSITION_CACHE_TTL``: freshness lifetime of an entry, in seconds.
+- ``POLLSPOSITION_OFFLINE``: if set to 1, only ever serve cached bytes.
+- ``POLLSPOSITION_DATA_URL``: a local directory or an HTTP server replacing
+  ``DATA_URL``, e.g. a checkout of the pollsposition/data repository.
+"""
+
+DATA_URL = "https://raw.githubusercontent.com/pollsposition/data/main/"
+
+SOURCES = {
+    "old_polls": "sondages/tour1_complet_unitedfl.csv",
+    "polls_2022": "sondages/presidentielles_2022.json",
+    "results": "resultats/presidentielles.json",
+    "unemployment": "predicteurs/chomage_national_trim.csv",
+}
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _atomic_write(path: Path, content: bytes):
+    """Write ``content`` to ``path`` so that concurrent readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # one temporary file per thread, as ``prefetch`` writes from several
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def _is_local(location: str) -> bool:
+    return urlparse(location).scheme in ("", "file") or os.path.isabs(location)
+
+
+def _local_path(location: str) -> Path:
+    parsed = urlparse(location)
+    if parsed.scheme == "file":
+        return Path(url2pathname(parsed.path))
+    return Path(location)
+
+
+class DataCache:
+    """Fetch the model's input files through a local content-addressed cache.
+
+    Parameters
+    ----------
+    cache_dir
+        Directory holding the cached files. Defaults to ``POLLSPOSITION_CACHE_DIR``
+        or ``~/.cache/pollsposition``.
+    ttl
+        Number of seconds during which a cached file is considered fresh and is
+        served without any network round-trip. Defaults to
+        ``POLLSPOSITION_CACHE_TTL`` or one hour.
+    offline
+        Never touch the network: serve cached bytes, however old they are, and
+        fail if a file was never cached. Defaults to ``POLLSPOSITION_OFFLINE``.
+    data_url
+        Replace ``DATA_URL`` by another location: either a local directory
+        (read directly, without caching) or the base URL of an HTTP server.
+        Defaults to ``POLLSPOSITION_DATA_URL``.
+    timeout
+        Timeout of each HTTP request, in seconds. Either one value for all the
+        sources, or a dict mapping keys of ``SOURCES`` to their own timeout,
+        with a ``"default"`` key for the other sources.
+    retries
+        How many times a request that failed on a network error, a timeout or
+        a server error is retried, with exponential backoff.
+    backoff
+        Delay before the first retry, in seconds. It doubles at each retry.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, Path]] = None,
+        ttl: Optional[float] = None,
+        offline: Optional[bool] = None,
+        data_url: Optional[str] = None,
+        timeout: Union[float, Dict[str, float]] = 30,
+        retries: int = 2,
+        backoff: float = 0.5,
+    ):
+        if cache_dir is None:
+            cache_dir = os.environ.get(
+                "POLLSPOSITION_CACHE_DIR", Path.home() / ".cache" / "pollsposition"
+            )
+        if ttl is None:
+            ttl = float(os.environ.get("POLLSPOSITION_CACHE_TTL", 3600))
+        if offline is None:
+            offline = os.environ.get("POLLSPOSITION_OFFLINE", "0") not in ("", "0")
+        if data_url is None:
+            data_url = os.environ.get("POLLSPOSITION_DATA_URL", DATA_URL)
+
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.ttl = ttl
+        self.offline = offline
+        self.data_url = data_url if data_url.endswith(("/", os.sep)) else data_url + "/"
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._prefetched = {}
+
+    def resolve(self, source: str) -> str:
+        """Turn a key of ``SOURCES``, a path relative to ``DATA_URL`` or a URL into a location."""
+        source = SOURCES.get(source, source)
+        if source.startswith(DATA_URL):
+            source = source[len(DATA_URL) :]
+        if "://" in source or os.path.isabs(source):
+            return source
+        if _is_local(self.data_url):
+            return str(_local_path(self.data_url) / source)
+        return self.data_url + source
+
+    def fetch(self, source: str) -> bytes:
+        """Return the content of ``source``, going to the network only when needed."""
+        location = self.resolve(source)
+        if location in self._prefetched:
+            return self._prefetched.pop(location)
+        if _is_local(location):
+            return _local_path(location).read_bytes()
+
+        entry = self._read_entry(location)
+        content = self._read_object(entry["sha256"]) if entry else None
+
+        if content is not None and (
+            self.offline or time.time() - entry["fetched_at"] < self.ttl
+        ):
+            return content
+        if self.offline:
+            raise FileNotFoundError(
+                f"{location} is not in the cache at {self.cache_dir} and offline "
+                "mode is on."
+            )
+
+        headers = {}
+        if content is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            new_content, etag, last_modified = self._request(
+                location, headers, self._timeout(source)
+            )
+        except HTTPError as err:
+            if content is None:
+                raise
+            if err.code == 304:
+                # not modified upstream: the cached copy is fresh again
+                entry["fetched_at"] = time.time()
+                self._write_entry(location, entry)
+                return content
+            warnings.warn(
+                f"Could not revalidate {location} ({err}); serving cached copy."
+            )
+            return content
+        except (URLError, OSError) as err:
+            if content is None:
+                raise
+            warnings.warn(
+                f"Could not revalidate {location} ({err}); serving cached copy."
+            )
+            return content
+
+        self._store(location, new_content, etag=etag, last_modified=last_modified)
+        return new_content
+
+    def prefetch(self, sources: Iterable[str], max_workers: Optional[int] = None):
+        """
+        Fetch several sources concurrently, and keep their content in memory
+        for the next call to ``fetch`` on each of them.
+
+        This returns once all the sources have been fetched, so the time spent
+        is that of the slowest source rather than the sum over all sources.
+        The first error met is raised once all fetches are done.
+        """
+        sources = list(sources)
+        with ThreadPoolExecutor(max_workers=max_workers or len(sources) or 1) as pool:
+            futures = {
+                self.resolve(source): pool.submit(self.fetch, source)
+                for source in sources
+            }
+        self._prefetched.update(
+            {location: future.result() for location, future in futures.items()}
+        )
+
+    def _timeout(self, source: str) -> float:
+        if isinstance(self.timeout, dict):
+            return self.timeout.get(source, self.timeout.get("default", 30))
+        return self.timeout
+
+    def _request(self, location: str, headers: Dict, timeout: float):
+        """GET ``location``, retrying on network errors, timeouts and server errors."""
+        for attempt in range(self.retries + 1):
+            try:
+                with urlopen(
+                    Request(location, headers=headers), timeout=timeout
+                ) as response:
+                    return (
+                        response.read(),
+                        response.headers.get("ETag"),
+                        response.headers.get("Last-Modified"),
+                    )
+            except HTTPError as err:
+                if err.code < 500 or attempt == self.retries:
+                    raise
+            except (URLError, OSError):
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2**attempt)
+
+    def digest(self, source: str) -> str:
+        """SHA-256 of the current content of ``source``."""
+        location = self.resolve(source)
+        if not _is_local(location):
+            entry = self._read_entry(location)
+            if entry and (self.cache_dir / "objects" / entry["sha256"]).exists():
+                if self.offline or time.time() - entry["fetched_at"] < self.ttl:
+                    return entry["sha256"]
+        return _sha256(self.fetch(source))
+
+    def _store(self, location: str, content: bytes, **headers):
+        sha = _sha256(content)
+        obj = self.cache_dir / "objects" / sha
+        if not obj.exists():
+            _atomic_write(obj, content)
+        self._write_entry(
+            location, {"sha256": sha, "fetched_at": time.time(), **headers}
+        )
+
+    def _index_path(self, location: str) -> Path:
+        return self.cache_dir / "index" / f"{_sha256(location.encode())}.json"
+
+    def _read_entry(self, location: str) -> Optional[Dict]:
+        try:
+            return json.loads(self._index_path(location).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_entry(self, location: str, entry: Dict):
+        entry = {"url": location} | entry
+        _atomic_write(self._index_path(location), json.dumps(entry).encode())
+
+    def _read_object(self, sha: str) -> Optional[bytes]:
+        try:
+            content = (self.cache_dir / "objects" / sha).read_bytes()
+        except FileNotFoundError:
+            return None
+        # guard against truncated or tampered objects
+        return content if _sha256(content) == sha else None
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from typing import Callable, Iterator, List, Tuple
+
+import numpy as np
+from utils._lazy import LazyModule, backend_module
+
+xr = LazyModule("xarray")
+
+"""
+Values of deterministics of a model computed after sampling, from the draws of
+its free variables.
+
+Recording a deterministic costs its evaluation at each draw and its size in the
+trace, which for the observation-level and per-day quantities is many times
+the size of the free variables. ``build_model(deterministics=...)`` only
+records the ones asked for, and ``draws_function`` and ``evaluate_draws``
+compute the others afterwards: the graph of the deterministics, restricted to
+the coordinates of interest, is compiled once and evaluated at each draw, one
+chunk of draws at a time to bound the memory.
+
+The graph can't be given a leading draws axis by substituting its inputs, as
+its indexing, dot products and the ops of its distributions assume the shapes
+of a single draw, and the backends of PyMC3 have no transform vectorizing a
+graph, so the draws are looped over from Python.
+"""
+
+
+def draws_function(inputs: List, outputs: List) -> Callable:
+    """
+    Function of stacks of values of ``inputs``, with the draws on the first
+    axis, returning the stacks of values of ``outputs`` at these draws. The
+    graph of ``outputs`` is compiled once, and called at each draw.
+    """
+    fn = backend_module().function(
+        inputs, outputs, on_unused_input="ignore", allow_input_downcast=True
+    )
+
+    def at_draws(*stacks: np.ndarray) -> List[np.ndarray]:
+        values = [fn(*draw) for draw in zip(*stacks)]
+        return [np.stack(value) for value in zip(*values)]
+
+    return at_draws
+
+
+def iter_draws(
+    fn: Callable, posterior: xr.Dataset, names: List[str], chunk_draws: int = 100
+) -> Iterator[Tuple[int, slice, List[np.ndarray]]]:
+    """
+    Chain, draws and outputs of the ``draws_function`` ``fn`` of the variables
+    ``names`` of ``posterior``, for each chunk of ``chunk_draws`` draws of each
+    chain. Only the chunk is loaded when ``posterior`` is backed by dask
+    arrays.
+    """
+    n_chains, n_draws = posterior.sizes["chain"], posterior.sizes["draw"]
+    variables = [posterior[name].transpose("chain", "draw", ...) for name in names]
+    for chain in range(n_chains):
+        for start in range(0, n_draws, chunk_draws):
+            draws = slice(start, min(start + chunk_draws, n_draws))
+            chunk = {"chain": chain, "draw": draws}
+            yield chain, draws, fn(*(var[chunk].to_numpy() for var in variables))
+
+
+def evaluate_draws(
+    fn: Callable, posterior: xr.Dataset, names: List[str], chunk_draws: int = 100
+) -> List[np.ndarray]:
+    """
+    Outputs of the ``draws_function`` ``fn`` of the variables ``names`` of
+    ``posterior``, as ``(chain, draw, ...)`` arrays, evaluated by chunks with
+    ``iter_draws``.
+    """
+    shape = (posterior.sizes["chain"], posterior.sizes["draw"])
+    results = None
+    for chain, draws, values in iter_draws(fn, posterior, names, chunk_draws):
+        if results is None:
+            results = [
+                np.empty(shape + value.shape[1:], dtype=value.dtype)
+                for value in values
+            ]
+        for result, value in zip(results, values):
+            result[chain, draws] = value
+    return results
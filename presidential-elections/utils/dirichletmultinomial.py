@@ -0,0 +1,319 @@
+from functools import lru_cache
+from typing import Dict, Tuple
+
+import numpy as np
+from scipy.special import digamma, gammaln
+from utils._lazy import LazyModule, backend_module, tensor_module
+
+pm = LazyModule("pymc3")
+theano = LazyModule("theano", loader=backend_module)
+tt = LazyModule("tt", loader=tensor_module)
+
+"""
+Dirichlet-Multinomial likelihood parametrized by logits, as one fused op.
+
+With ``a = c * softmax(logits)``, the concentrations sum to ``c``, and the
+log-density of counts ``x`` with total ``N`` is
+
+    log N! - Σ log x_k! + log Γ(c) - log Γ(N + c) + Σ [log Γ(x_k + a_k) - log Γ(a_k)]
+
+where the last sum only runs over the non-zero counts, since the other terms
+vanish. ``DirichletMultinomialLogp`` evaluates it, and its gradient with
+respect to the logits and to ``c``, in a single vectorized pass over the
+non-zero counts, instead of the softmax, product and generic
+``pm.DirichletMultinomial`` graph, and computes the terms that only depend on
+the data once.
+
+The op and the distribution derive from classes of the backend and of PyMC3,
+so they are only defined when first used, and the numpy functions can be
+imported, e.g. by the processes drawing the posterior predictive, without
+importing the PPL stack.
+"""
+
+
+def competing_mask(mask: np.ndarray) -> np.ndarray:
+    """
+    Boolean mask of the parties that compete in each row. Rows without any
+    competing party, like the placeholder polls of ``forecast_election``, are
+    left unmasked.
+    """
+    mask = np.asarray(mask).astype(bool)
+    return mask | ~mask.any(axis=-1, keepdims=True)
+
+
+def masked_log_softmax(logits: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Log-softmax of ``logits`` over the last axis, -inf where ``mask`` is False."""
+    logits = np.where(mask, logits, -np.inf)
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+def masked_softmax(logits, mask):
+    """Softmax of the tensor ``logits`` over the last axis, 0 where ``mask`` is False."""
+    return tt.nnet.softmax(tt.switch(mask, logits, -np.inf))
+
+
+def multinomial_rvs(
+    rng: np.random.Generator, n: np.ndarray, p: np.ndarray
+) -> np.ndarray:
+    """
+    Multinomial draws for any batch of totals ``n`` and probabilities ``p``,
+    whose last axis is the categories, as a chain of binomial draws: each
+    category gets a binomial share of what the previous ones left, with the
+    probability of the category given that it is not one of them.
+    """
+    n = np.broadcast_to(np.asarray(n, dtype=np.int64), p.shape[:-1])
+    # probability left for each category and the ones after it
+    tail = np.cumsum(p[..., ::-1], axis=-1)[..., ::-1]
+
+    counts = np.empty(p.shape, dtype=np.int64)
+    remaining = n.copy()
+    for k in range(p.shape[-1] - 1):
+        q = np.divide(
+            p[..., k], tail[..., k], out=np.zeros(n.shape), where=tail[..., k] > 0
+        )
+        counts[..., k] = rng.binomial(remaining, np.clip(q, 0, 1))
+        remaining -= counts[..., k]
+    counts[..., -1] = remaining
+
+    return counts
+
+
+def dirichlet_multinomial_rvs(
+    rng: np.random.Generator, n: np.ndarray, alpha: np.ndarray
+) -> np.ndarray:
+    """
+    Dirichlet-Multinomial draws for any batch of totals ``n`` and
+    concentrations ``alpha``, whose last axis is the categories: gamma draws,
+    normalized into Dirichlet probabilities, then multinomial draws.
+    """
+    p = rng.standard_gamma(alpha)
+    p /= p.sum(axis=-1, keepdims=True)
+    return multinomial_rvs(rng, n, p)
+
+
+class _DirichletMultinomialLogp:
+    """
+    Log-density of each row of ``counts``, with totals ``n``, under a
+    Dirichlet-Multinomial whose concentrations are ``concentration *
+    softmax(logits)`` over the parties of ``mask``. ``concentration`` is a
+    scalar or has one value per row.
+
+    The op has three outputs: the log-densities, and their gradients with
+    respect to ``logits`` and to the concentration of each row, which are
+    computed in the same pass and which the gradient of the log-densities is
+    built from. The gradient with respect to the data is not defined.
+
+    The terms that only depend on the data are computed once, and computed
+    again only when the values of the data change. With ``cache_data=False``,
+    e.g. for minibatches, whose data changes at each evaluation, they are
+    computed at each evaluation.
+    """
+
+    def __init__(self, cache_data: bool = True):
+        self.cache_data = cache_data
+        self._data = None
+        self._data_terms = None
+
+    def make_node(self, logits, concentration, counts, n, mask):
+        logits = tt.as_tensor_variable(logits)
+        concentration = tt.as_tensor_variable(concentration)
+        counts = tt.as_tensor_variable(counts)
+        n = tt.as_tensor_variable(n)
+        mask = tt.as_tensor_variable(mask)
+        if concentration.ndim > 1:
+            raise ValueError("concentration must be a scalar or a vector.")
+
+        return theano.Apply(
+            self,
+            [logits, concentration, counts, n, mask],
+            [
+                tt.TensorType(logits.dtype, (False,))(),
+                logits.type(),
+                tt.TensorType(concentration.dtype, (False,))(),
+            ],
+        )
+
+    def _get_data_terms(
+        self, counts: np.ndarray, n: np.ndarray, mask: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The normalizing constant of each row, the positions and values of the
+        non-zero counts, and the rows with counts outside of their mask.
+        """
+        data = (counts, n, mask)
+        # compared by value: the backend may refill the same arrays in place
+        if self.cache_data and (
+            self._data is not None
+            and all(np.array_equal(new, old) for new, old in zip(data, self._data))
+        ):
+            return self._data_terms
+
+        const = gammaln(n + 1.0) - gammaln(counts + 1.0).sum(axis=-1)
+        rows, cols = np.nonzero(counts)
+        invalid = np.zeros(len(counts), dtype=bool)
+        invalid[rows[~mask[rows, cols]]] = True
+        data_terms = const, rows, cols, counts[rows, cols], invalid
+        if self.cache_data:
+            self._data = tuple(np.array(array) for array in data)
+            self._data_terms = data_terms
+        return data_terms
+
+    def perform(self, node, inputs, outputs):
+        logits, concentration, counts, n, mask = inputs
+        const, rows, cols, x, invalid = self._get_data_terms(counts, n, mask)
+
+        log_p = masked_log_softmax(logits, mask)
+        p = np.exp(log_p)
+        c = np.broadcast_to(concentration, n.shape)
+        a = c[rows] * p[rows, cols]
+
+        logp = (
+            const
+            + gammaln(c)
+            - gammaln(n + c)
+            + np.bincount(rows, gammaln(x + a) - gammaln(a), minlength=len(n))
+        )
+        logp[invalid] = -np.inf
+
+        # d logp / d a_k, only non-zero where the count is
+        dlogp_da = digamma(x + a) - digamma(a)
+        a_dlogp_da = np.zeros_like(p)
+        a_dlogp_da[rows, cols] = a * dlogp_da
+        dlogits = a_dlogp_da - p * a_dlogp_da.sum(axis=-1, keepdims=True)
+        dconcentration = (
+            digamma(c)
+            - digamma(n + c)
+            + np.bincount(rows, dlogp_da * p[rows, cols], minlength=len(n))
+        )
+
+        outputs[0][0] = np.asarray(logp, dtype=node.outputs[0].dtype)
+        outputs[1][0] = np.asarray(dlogits, dtype=node.outputs[1].dtype)
+        outputs[2][0] = np.asarray(dconcentration, dtype=node.outputs[2].dtype)
+
+    def grad(self, inputs, output_grads):
+        logits, concentration = inputs[:2]
+        if not all(
+            isinstance(g.type, theano.gradient.DisconnectedType)
+            for g in output_grads[1:]
+        ):
+            raise NotImplementedError(
+                "The gradients computed by DirichletMultinomialLogp can't be "
+                "differentiated."
+            )
+        g_logp = output_grads[0]
+        _, dlogits, dconcentration = self(*inputs)
+
+        g_concentration = g_logp * dconcentration
+        if concentration.ndim == 0:
+            g_concentration = g_concentration.sum()
+        return [g_logp[:, None] * dlogits, g_concentration] + [
+            theano.gradient.grad_undefined(self, i, inputs[i]) for i in (2, 3, 4)
+        ]
+
+
+class _SoftmaxDirichletMultinomial:
+    """
+    Dirichlet-Multinomial distribution of counts whose concentrations are
+    ``concentration * softmax(logits)``, with the log-density of
+    ``DirichletMultinomialLogp``.
+
+    Parameters
+    ----------
+    logits
+        Logits of the expected shares, with the categories on the last axis.
+    concentration
+        Sum of the concentrations, as a scalar or one value per row.
+    n
+        Total count of each row.
+    mask : np.ndarray, optional
+        Which categories can be observed in each row; the others are left out
+        of the softmax, so that their share is exactly 0. Rows without any
+        category are not masked. Defaults to all categories. A tensor is
+        used as is, and must be a ``competing_mask``.
+    """
+
+    def __init__(self, logits, concentration, n, mask=None, *args, **kwargs):
+        shape = kwargs.pop("shape")
+        self.logits = tt.as_tensor_variable(logits)
+        self.concentration = tt.as_tensor_variable(concentration)
+        self.n = tt.as_tensor_variable(n)
+        if mask is None:
+            mask = np.ones(shape, dtype=bool)
+        if isinstance(mask, np.ndarray):
+            mask = competing_mask(mask)
+        self.mask = tt.as_tensor_variable(mask)
+
+        # the shares times the totals, which only approximates the mode
+        shares = masked_softmax(self.logits, self.mask)
+        self.mode = tt.cast(tt.round(shares * self.n[..., None]), "int64")
+
+        super().__init__(shape=shape, defaults=("mode",), *args, **kwargs)
+
+    def logp(self, value):
+        # the data terms can't be cached for data computed in the graph, like
+        # the minibatches of ``fit_vi``
+        constant_data = all(
+            getattr(var, "owner", None) is None for var in (value, self.n, self.mask)
+        )
+        logp, _, _ = DirichletMultinomialLogp(cache_data=constant_data)(
+            self.logits, self.concentration, value, self.n, self.mask
+        )
+        return pm.distributions.dist_math.bound(logp, tt.all(self.concentration > 0))
+
+    def random(self, point=None, size=None):
+        logits, concentration, n, mask = pm.distributions.draw_values(
+            [self.logits, self.concentration, self.n, self.mask],
+            point=point,
+            size=size,
+        )
+        shares = np.exp(masked_log_softmax(logits, mask))
+        # one concentration per sample, or per sample and row
+        concentration = np.asarray(concentration)[
+            (...,) + (None,) * (2 - self.concentration.ndim)
+        ]
+        alpha = concentration * shares
+        if size is not None:
+            alpha = np.broadcast_to(
+                alpha, tuple(np.atleast_1d(size)) + alpha.shape[-2:]
+            )
+
+        rng = np.random.default_rng(np.random.randint(np.iinfo(np.int32).max))
+        return dirichlet_multinomial_rvs(rng, np.asarray(n), alpha)
+
+    def _distr_parameters_for_repr(self):
+        return ["concentration", "n"]
+
+
+@lru_cache(maxsize=None)
+def _define_classes() -> Dict[str, type]:
+    """
+    Define ``DirichletMultinomialLogp`` and ``SoftmaxDirichletMultinomial`` in
+    this module, from the backend's ``Op`` and PyMC3's ``Discrete``.
+    """
+    classes = {
+        "DirichletMultinomialLogp": type(
+            "DirichletMultinomialLogp",
+            (_DirichletMultinomialLogp, theano.Op),
+            # the backend builds the equality of ops from ``__props__`` when
+            # the class is created
+            {"__props__": ("cache_data",), "__module__": __name__},
+        ),
+        "SoftmaxDirichletMultinomial": type(
+            "SoftmaxDirichletMultinomial",
+            (_SoftmaxDirichletMultinomial, pm.Discrete),
+            {"__module__": __name__},
+        ),
+    }
+    for name, cls in classes.items():
+        cls.__doc__ = cls.__bases__[0].__doc__
+    globals().update(classes)
+    return classes
+
+
+def __getattr__(name):
+    # the classes are only defined when first used, and pickled instances find
+    # them here by name
+    if name in ("DirichletMultinomialLogp", "SoftmaxDirichletMultinomial"):
+        return _define_classes()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
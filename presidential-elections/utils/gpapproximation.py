@@ -1,28 +1,100 @@
-from typing import List, Optional, Union
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
 
 import numpy as np
-import pandas as pd
-import pymc3 as pm
-from scipy import linalg
+from utils._lazy import LazyModule, tensor_module
+
+aet = LazyModule("aet", loader=tensor_module)
+fft = LazyModule("scipy.fft")
+linalg = LazyModule("scipy.linalg")
+pd = LazyModule("pandas")
+pm = LazyModule("pymc3")
 
 """
 Code mainly contributed by Adrian Seyboldt (@aseyboldt) and Luciano Paz (@lucianopaz).
 """
 
+# Bump when the bases computed for a given configuration change, so that the
+# bases stored on disk by earlier versions are not reused.
+BASIS_CACHE_VERSION = 2
+
+
+def _zerosum_direction(N: int, a: Optional[np.ndarray] = None) -> np.ndarray:
+    """Unit vector along ``a``, which defaults to a vector of all 1s."""
+    if a is not None:
+        a = np.asarray(a)
+        if a.ndim != 1:
+            raise NotImplementedError("`a` can only be a vector.")
+        assert N == len(a), "The `a` vector must have same length as the GP cov matrix."
+        a = a.astype(float)
+    else:
+        a = np.ones(N)
+    return a / np.sqrt(a @ a)
+
 
-def make_sum_zero_hh(N: int) -> np.ndarray:
+def make_sum_zero_hh(N: int, a: Optional[np.ndarray] = None) -> np.ndarray:
     """
-    Build a householder transformation matrix that maps e_1 to a vector of all 1s.
+    Build a householder transformation matrix that maps e_1 to a vector of all 1s,
+    or to the direction of ``a``.
     """
     e_1 = np.zeros(N)
     e_1[0] = 1
-    a = np.ones(N)
-    a /= np.sqrt(a @ a)
+    a = _zerosum_direction(N, a)
     v = e_1 - a
     v /= np.sqrt(v @ v)
     return np.eye(N) - 2 * np.outer(v, v)
 
 
+def _project_zerosum(cov: np.ndarray, a: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Restrict the symmetric covariance matrix ``cov`` in place to the functions
+    that sum to zero, or whose ``a``-weighted sum is zero, in O(n²).
+
+    With the householder matrix ``Q`` of ``make_sum_zero_hh`` and ``D`` the
+    identity without its first entry, ``Q.T @ D @ Q`` is the rank-one
+    projection ``P = I - â âᵀ`` where ``â = a / |a|``, so that
+    ``P C P = C - â uᵀ - (u - (âᵀu) â) âᵀ`` with ``u = C â``.
+    """
+    n = len(cov)
+    a = _zerosum_direction(n, a).astype(cov.dtype)
+    u = cov @ a
+    v = u - (a @ u) * a
+
+    # by blocks of rows, to keep the temporaries small
+    block_size = max(1, 2**20 // n)
+    for start in range(0, n, block_size):
+        rows = slice(start, start + block_size)
+        cov[rows] -= np.outer(a[rows], u) + np.outer(v[rows], a)
+
+    return cov
+
+
+def _gaussian_weights(
+    lengthscale: Union[float, str, List[Union[float, str]]],
+    variance_weight: Optional[List[float]],
+):
+    """Check the lengthscales and weights of a sum of gaussian kernels."""
+    if isinstance(lengthscale, (int, float, str)):
+        lengthscale = [lengthscale]
+
+    if variance_weight:
+        assert len(variance_weight) == len(
+            lengthscale
+        ), "`variance_weight` must have the same length as `lengthscale`."
+        variance_weight = np.asarray(variance_weight)
+        assert np.isclose(
+            variance_weight.sum(), 1.0
+        ), "`variance_weight` must sum to 1."
+    else:
+        variance_weight = np.ones(len(lengthscale))
+
+    return lengthscale, variance_weight
+
+
 def make_centered_gp_eigendecomp(
     time: np.ndarray,
     lengthscale: Union[float, str, List[Union[float, str]]] = 1,
@@ -31,6 +103,10 @@ def make_centered_gp_eigendecomp(
     kernel: str = "gaussian",
     zerosum: bool = False,
     period: Optional[Union[float, str]] = None,
+    a: Optional[np.ndarray] = None,
+    method: str = "eigh",
+    boundary_factor: float = 1.5,
+    dtype: str = "float64",
 ):
     """
     Decompose the GP into eigen values and eigen vectors.
@@ -55,35 +131,48 @@ def make_centered_gp_eigendecomp(
         thus sum to 0 along the time axis.
     period : float or str
         Only used if the kernel is periodic. Determines the period of the kernel.
+    a : Optional[np.ndarray]
+        Only used with ``zerosum``. Weights of the sum constrained to 0, e.g.
+        the number of observations at each time point when they are uneven.
+        The resulting GP then satisfies ``a @ gp = 0``.
+    method : str
+        ``"eigh"`` to decompose the full covariance matrix, ``"fft"`` to use
+        the Toeplitz structure of the covariance matrix of the stationary
+        kernels on evenly spaced time points (other grids and kernels fall
+        back to ``"eigh"``), or ``"hsgp"`` for the Hilbert-space approximation
+        of ``make_hsgp_basis``. Both scale to long time grids. ``make_gp_basis``
+        also accepts ``"statespace"`` with the ``"randomwalk"`` kernel, which
+        gives a ``RandomWalkBasis``.
+    boundary_factor : float
+        Only used by the ``"hsgp"`` method, see ``make_hsgp_basis``.
+    dtype : str
+        Floating point type of the covariance matrix and of the basis.
+        ``"float32"`` halves the memory of the decomposition, which is the
+        largest allocation, and makes it about twice as fast.
     """
-
-    ## Construct covariance matrix
-    X = time[:, None]
+    if method == "hsgp":
+        return make_hsgp_basis(
+            time,
+            lengthscale=lengthscale,
+            variance_limit=variance_limit,
+            variance_weight=variance_weight,
+            kernel=kernel,
+            zerosum=zerosum,
+            a=a,
+            boundary_factor=boundary_factor,
+            dtype=dtype,
+        )
+    elif method not in ("eigh", "fft"):
+        raise ValueError(
+            f"Unknown method = {method}. Accepted values are 'eigh', 'fft' and 'hsgp'"
+        )
 
     if kernel == "gaussian":
-        if isinstance(lengthscale, (int, float, str)):
-            lengthscale = [lengthscale]
-
-        if variance_weight:
-            assert len(variance_weight) == len(
-                lengthscale
-            ), "`variance_weight` must have the same length as `lengthscale`."
-            variance_weight = np.asarray(variance_weight)
-            assert np.isclose(
-                variance_weight.sum(), 1.0
-            ), "`variance_weight` must sum to 1."
-        else:
-            variance_weight = np.ones_like(lengthscale)
-
-        dists = []
-        for ls in lengthscale:
-            if isinstance(ls, str):
-                ls = pd.to_timedelta(ls).to_timedelta64()
-            dists.append(((X - X.T) / np.array(ls)) ** 2)
-
-        cov = sum(
-            w * np.exp(-dist / 2) for (w, dist) in zip(variance_weight, dists)
-        ) / len(lengthscale)
+        lengthscale, variance_weight = _gaussian_weights(lengthscale, variance_weight)
+        lengthscale = [
+            pd.to_timedelta(ls).to_timedelta64() if isinstance(ls, str) else ls
+            for ls in lengthscale
+        ]
         # https://gist.github.com/bwengals/481e1f2bc61b0576280cf0f77b8303c6
 
     elif kernel == "periodic":
@@ -98,9 +187,6 @@ def make_centered_gp_eigendecomp(
         elif isinstance(period, str):
             period = pd.to_timedelta(period).to_timedelta64()
 
-        dists = np.pi * ((time[:, None] - time[None, :]) / period)
-        cov = np.exp(-2 * (np.sin(dists) / lengthscale) ** 2)
-
     # https://gpflow.readthedocs.io/en/master/notebooks/tailor/kernel_design.html
     elif kernel == "randomwalk":
         if np.testing.assert_allclose(lengthscale, 1):
@@ -111,25 +197,42 @@ def make_centered_gp_eigendecomp(
             raise NotImplementedError(
                 f"`variance_weight` can only be used with the Gaussian kernel."
             )
-        cov = np.minimum(X, X.T)
 
     else:
         raise ValueError(
             f"Unknown kernel = {kernel}. Accepted values are 'gaussian' and 'periodic'"
         )
 
-    if zerosum:
-        Q = make_sum_zero_hh(len(cov))
-        D = np.eye(len(cov))
-        D[0, 0] = 0
+    step = _regular_step(time) if method == "fft" else None
+    if step is not None and kernel != "randomwalk":
+        return _fft_basis(
+            len(time),
+            step,
+            kernel,
+            lengthscale,
+            variance_weight,
+            period,
+            variance_limit,
+            zerosum,
+            a,
+            dtype,
+        )
+
+    def covariance() -> np.ndarray:
+        cov = _covariance_matrix(
+            time, kernel, lengthscale, variance_weight, period, dtype
+        )
+        if zerosum:
+            # same as Q.T @ D @ Q @ cov @ Q.T @ D @ Q with Q the householder
+            # matrix, which moves the mean to the first entry, and D the
+            # projection that drops it
+            cov = _project_zerosum(cov, a)
+        return cov
 
-        # 1) Transform the covariance matrix so that the first entry
-        # is the mean: A = Q @ cov @ Q.T
-        # 2) Project onto the subspace without the mean: B = D @ A @ D
-        # 3) Transform the result back to the original space: Q.T @ B @ Q
-        cov = Q.T @ D @ Q @ cov @ Q.T @ D @ Q
+    if variance_limit != 1:
+        return _leading_eigenbasis(covariance, variance_limit)
 
-    vals, vecs = linalg.eigh(cov)
+    vals, vecs = linalg.eigh(covariance().T, overwrite_a=True, check_finite=False)
     precision_limit_inds = np.logical_or(vals < 0, np.imag(vals) != 0)
 
     if np.any(precision_limit_inds):
@@ -137,16 +240,561 @@ def make_centered_gp_eigendecomp(
         vals = vals[len(vals) - cutoff :]
         vecs = vecs[:, vecs.shape[1] - cutoff :]
 
-    if variance_limit == 1:
-        n_eigs = len(vals)
+    return vecs * np.sqrt(vals)
+
+
+def _covariance_matrix(
+    time: np.ndarray,
+    kernel: str,
+    lengthscale: List,
+    variance_weight: Optional[np.ndarray],
+    period: Optional[Union[float, np.timedelta64]],
+    dtype: str,
+) -> np.ndarray:
+    """
+    Build the covariance matrix by blocks of rows into a single n×n buffer, so
+    that the temporaries never exceed a few megabytes.
+    """
+    n = len(time)
+    cov = np.empty((n, n), dtype=dtype)
+    block_size = max(1, 2**20 // n)
+
+    for start in range(0, n, block_size):
+        rows = time[start : start + block_size, None]
+        if kernel == "randomwalk":
+            cov[start : start + block_size] = np.minimum(rows, time[None, :])
+        else:
+            cov[start : start + block_size] = _stationary_kernel(
+                rows - time[None, :], kernel, lengthscale, variance_weight, period
+            )
+
+    return cov
+
+
+def _stationary_kernel(
+    lags: np.ndarray,
+    kernel: str,
+    lengthscale: List,
+    variance_weight: Optional[np.ndarray],
+    period: Optional[Union[float, np.timedelta64]],
+) -> np.ndarray:
+    """Covariance of the gaussian or periodic kernel between points ``lags`` apart."""
+    if kernel == "gaussian":
+        return sum(
+            w * np.exp(-((lags / np.array(ls)) ** 2) / 2)
+            for (w, ls) in zip(variance_weight, lengthscale)
+        ) / len(lengthscale)
+
+    dists = np.pi * (lags / period)
+    return np.exp(-2 * (np.sin(dists) / lengthscale) ** 2)
+
+
+def _regular_step(time: np.ndarray):
+    """The step between successive time points if they are evenly spaced, else None."""
+    if len(time) < 2:
+        return None
+    steps = np.diff(time)
+    if np.issubdtype(steps.dtype, np.floating):
+        regular = np.allclose(steps, steps[0], rtol=1e-9, atol=0)
+    else:
+        regular = np.all(steps == steps[0])
+    if not regular or steps[0] == np.zeros_like(steps[0]):
+        return None
+    return steps[0]
+
+
+def _fft_basis(
+    n: int,
+    step,
+    kernel: str,
+    lengthscale: List,
+    variance_weight: Optional[np.ndarray],
+    period: Optional[Union[float, np.timedelta64]],
+    variance_limit: float,
+    zerosum: bool,
+    a: Optional[np.ndarray],
+    dtype: str,
+) -> np.ndarray:
+    """
+    Basis of a stationary GP on a regular grid of ``n`` points, from the
+    circulant embedding of its Toeplitz covariance matrix.
+
+    The covariance matrix is the top-left block of a circulant matrix of size
+    ``M >= 2(n - 1)``, whose first row holds the kernel at the lags around the
+    circle. The eigenvalues of a circulant matrix are the FFT of its first row
+    and its eigenvectors are the Fourier modes, so that the covariance matrix
+    is ``F F.T``, with ``F`` the cosines and sines at the frequencies ``k / M``
+    weighted by the square root of these eigenvalues. Negative eigenvalues,
+    which appear when the lengthscale is long compared to the grid, are
+    dropped.
+
+    The Fourier modes restricted to the grid are not orthogonal, so the
+    frequencies carrying most of the variance are then compressed to the
+    leading eigenvectors of ``F F.T`` through the small matrix ``F.T F``. The
+    basis thus has as many functions as the one of the dense decomposition,
+    for O(M log M + n·m²) operations with ``m`` the number of frequencies, and
+    no n×n matrix is allocated.
+    """
+    n_circle = fft.next_fast_len(2 * (n - 1), real=True)
+    if kernel == "periodic" and abs(period / step) >= 1:
+        n_period = float(abs(period / step))
+        if n_period.is_integer():
+            # a whole number of periods around the circle embeds the kernel
+            # exactly
+            n_circle = int(n_period) * -(-2 * (n - 1) // int(n_period))
+    positions = np.arange(n_circle)
+    lags = np.minimum(positions, n_circle - positions) * step
+    spectrum = fft.rfft(
+        _stationary_kernel(lags, kernel, lengthscale, variance_weight, period)
+    ).real
+
+    # variance of the covariance matrix, i.e. its trace, once restricted to
+    # the functions with a zero sum
+    variance = _stationary_kernel(
+        lags[:1], kernel, lengthscale, variance_weight, period
+    )
+    total = n * variance[0]
+    if zerosum:
+        direction = _zerosum_direction(n, a)
+        # Toeplitz product by the FFT of the circulant matrix
+        cov_direction = fft.irfft(
+            spectrum * fft.rfft(direction, n=n_circle), n=n_circle
+        )[:n]
+        total -= direction @ cov_direction
+
+    # the variance carried by each frequency: its eigenvalue, twice for the
+    # frequencies whose eigenvalue appears at k and M - k
+    weights = np.clip(spectrum, 0, None) / n_circle
+    weights[1 : (n_circle + 1) // 2] *= 2
+    if zerosum and a is None:
+        # the constant function does not sum to zero
+        weights[0] = 0
+
+    # keep the frequencies that carry all but a small part of what the basis
+    # will leave out
+    order = np.argsort(weights)[::-1]
+    n_freqs = np.count_nonzero(weights)
+    if variance_limit != 1:
+        n_freqs = min(
+            np.searchsorted(
+                weights[order].cumsum() / weights.sum(),
+                1 - (1 - variance_limit) / 10,
+            )
+            + 1,
+            n_freqs,
+        )
+    freqs = np.sort(order[:n_freqs])
+    has_sine = (freqs > 0) & (2 * freqs != n_circle)
+
+    # built in place, as the modes are the only n×m arrays
+    omegas = (2 * np.pi * freqs / n_circle).astype(dtype)
+    scale = np.sqrt(weights[freqs]).astype(dtype)
+    grid = np.arange(n, dtype=dtype)
+    modes = np.empty((n, len(freqs) + np.count_nonzero(has_sine)), dtype=dtype)
+    cosines, sines = modes[:, : len(freqs)], modes[:, len(freqs) :]
+    np.multiply.outer(grid, omegas, out=cosines)
+    np.multiply.outer(grid, omegas[has_sine], out=sines)
+    np.cos(cosines, out=cosines)
+    np.sin(sines, out=sines)
+    cosines *= scale
+    sines *= scale[has_sine]
+    if zerosum:
+        direction = direction.astype(dtype)
+        projection = direction @ modes
+        block_size = max(1, 2**20 // modes.shape[1])
+        for start in range(0, n, block_size):
+            rows = slice(start, start + block_size)
+            modes[rows] -= np.outer(direction[rows], projection)
+
+    vals, vecs = linalg.eigh(modes.T @ modes)
+    vals, vecs = vals[::-1], vecs[:, ::-1]
+    n_positive = np.argmin(vals > 0) if np.any(vals <= 0) else len(vals)
+    n_eigs = n_positive
+    if variance_limit != 1:
+        exceeded = (vals[:n_positive].cumsum() / total > variance_limit).nonzero()[0]
+        if len(exceeded):
+            n_eigs = max(exceeded[0], 1)
+
+    # in increasing order of eigenvalue, as returned by ``linalg.eigh``
+    return modes @ vecs[:, n_eigs - 1 :: -1]
+
+
+def _leading_eigenbasis(
+    covariance: Callable[[], np.ndarray], variance_limit: float
+) -> np.ndarray:
+    """
+    Leading eigenvectors of the matrix returned by ``covariance``, scaled by
+    the square root of their eigenvalue, that explain ``variance_limit`` of its
+    trace.
+
+    Only the leading eigenpairs are computed. If they turn out to explain too
+    little of the trace, twice as many are computed. The decomposition happens
+    in place, so the matrix is built again for each attempt rather than kept.
+    """
+    cov = covariance()
+    n = len(cov)
+    n_computed = min(n, max(64, n // 8))
+    while True:
+        total = np.trace(cov)
+        # the transpose of the symmetric matrix is the same matrix in Fortran
+        # order, which LAPACK overwrites without copying it first
+        vals, vecs = linalg.eigh(
+            cov.T,
+            subset_by_index=[n - n_computed, n - 1],
+            driver="evr",
+            overwrite_a=True,
+            check_finite=False,
+        )
+        del cov
+
+        # eigenvalues in decreasing order, up to the first one lost to the
+        # numerical precision
+        vals, vecs = vals[::-1], vecs[:, ::-1]
+        n_positive = np.argmin(vals > 0) if np.any(vals <= 0) else len(vals)
+        exceeded = (vals[:n_positive].cumsum() / total > variance_limit).nonzero()[0]
+        if len(exceeded):
+            n_eigs = max(exceeded[0], 1)
+            break
+        if n_computed == n or n_positive < n_computed:
+            n_eigs = n_positive
+            break
+
+        n_computed = min(n, 2 * n_computed)
+        cov = covariance()
+
+    # in increasing order of eigenvalue, as returned by ``linalg.eigh``
+    return vecs[:, n_eigs - 1 :: -1] * np.sqrt(vals[n_eigs - 1 :: -1])
+
+
+def make_hsgp_basis(
+    time: np.ndarray,
+    lengthscale: Union[float, str, List[Union[float, str]]] = 1,
+    variance_limit: float = 0.95,
+    variance_weight: Optional[List[float]] = None,
+    kernel: str = "gaussian",
+    zerosum: bool = False,
+    a: Optional[np.ndarray] = None,
+    boundary_factor: float = 1.5,
+    dtype: str = "float64",
+):
+    """
+    Approximate the GP with the Hilbert-space method of [1]_.
+
+    The basis functions are the eigenfunctions of the Laplacian on
+    ``[-L, L]`` around the time grid, weighted by the spectral density of the
+    kernel at their frequency. Building the basis costs O(n·m) for ``n``
+    time points and ``m`` basis functions, and no n×n matrix is allocated.
+
+    Parameters
+    ----------
+    time, lengthscale, variance_limit, variance_weight, zerosum, a
+        As in ``make_centered_gp_eigendecomp``. The number of basis functions
+        is the smallest one whose spectral weights add up to ``variance_limit``
+        of the total.
+    kernel : str
+        Only the gaussian kernel is supported.
+    boundary_factor : float
+        ``L`` as a multiple of half the length of the time grid. Larger values
+        approximate the kernel better near the edges of the grid, but need
+        more basis functions.
+    dtype : str
+        Floating point type of the basis.
+
+    References
+    ----------
+    .. [1]: Solin, Arno, and Simo Särkkä. “Hilbert Space Methods for Reduced-Rank
+            Gaussian Process Regression.” Statistics and Computing 30, no. 2 (2020): 419–446.
+    """
+    if kernel != "gaussian":
+        raise NotImplementedError(
+            "The HSGP approximation is only implemented for the Gaussian kernel."
+        )
+    lengthscale, variance_weight = _gaussian_weights(lengthscale, variance_weight)
+
+    if np.issubdtype(time.dtype, np.datetime64):
+        x = (time - time.min()) / np.timedelta64(1, "D")
+        lengthscale = np.array(
+            [pd.to_timedelta(ls) / pd.Timedelta(1, "D") for ls in lengthscale]
+        )
+    else:
+        x = np.asarray(time, dtype=float)
+        lengthscale = np.asarray(lengthscale, dtype=float)
+    center = (x.max() + x.min()) / 2
+    L = boundary_factor * max((x.max() - x.min()) / 2, lengthscale.max())
+
+    # the spectral density of the shortest lengthscale is negligible past
+    # this number of basis functions
+    n_max = int(
+        np.ceil(2 * L * np.sqrt(2 * np.log(1e12)) / (np.pi * lengthscale.min()))
+    )
+    freqs = np.pi * np.arange(1, n_max + 1) / (2 * L)
+    spectral_density = (variance_weight / len(lengthscale)) @ (
+        np.sqrt(2 * np.pi)
+        * lengthscale[:, None]
+        * np.exp(-0.5 * (lengthscale[:, None] * freqs) ** 2)
+    )
 
+    if variance_limit == 1:
+        n_basis = n_max
     else:
-        n_eigs = ((vals[::-1].cumsum() / vals.sum()) > variance_limit).nonzero()[0][0]
+        n_basis = min(
+            np.searchsorted(
+                spectral_density.cumsum() / spectral_density.sum(), variance_limit
+            )
+            + 1,
+            n_max,
+        )
+
+    # computed in place, as the basis is the only n×m array
+    basis = np.multiply.outer(
+        (x - center + L).astype(dtype), freqs[:n_basis].astype(dtype)
+    )
+    np.sin(basis, out=basis)
+    basis *= np.sqrt(spectral_density[:n_basis] / L)
+    if zerosum:
+        # projecting the basis functions applies the same projection as the
+        # householder transformation in ``make_centered_gp_eigendecomp``
+        a = _zerosum_direction(len(x), a).astype(dtype)
+        basis -= np.outer(a, a @ basis)
+
+    return basis
+
+
+class RandomWalkBasis:
+    """Random walk over a time grid, as a cumulative sum of independent increments.
+
+    The ``"randomwalk"`` kernel ``min(t, t')`` is the covariance of a
+    brownian motion started at 0, whose precision matrix is tridiagonal. Its
+    exact basis is thus the lower triangular matrix scaling and summing the
+    increments, which is applied in O(n) without ever being built. It stands
+    for the basis of ``make_centered_gp_eigendecomp(time, kernel="randomwalk")``
+    with ``variance_limit=1``: ``basis.dot(coefs)`` has the distribution of
+    ``basis_funcs @ coefs`` for standard normal coefficients.
+
+    Parameters
+    ----------
+    time : np.ndarray
+        Increasing, non-negative time points.
+    zerosum : bool
+        Constrain the random walk to sum to 0 along the time axis.
+    a : Optional[np.ndarray]
+        Only used with ``zerosum``, the weights of the sum constrained to 0.
+    dtype : str
+        Floating point type of the scales of the increments.
+    """
+
+    def __init__(
+        self,
+        time: np.ndarray,
+        zerosum: bool = False,
+        a: Optional[np.ndarray] = None,
+        dtype: str = "float64",
+    ):
+        time = np.asarray(time, dtype=dtype)
+        if np.any(np.diff(time) < 0) or time[0] < 0:
+            raise ValueError(
+                "The random walk needs increasing, non-negative time points."
+            )
+
+        # standard deviation of each increment, from 0 to the first time point
+        self.scale = np.sqrt(np.diff(time, prepend=0))
+        self.direction = (
+            _zerosum_direction(len(time), a).astype(dtype) if zerosum else None
+        )
+
+    @property
+    def shape(self):
+        return len(self.scale), len(self.scale)
+
+    def dot(self, coefs):
+        """
+        The random walk of the increments ``coefs``, whose first axis is the
+        time axis. Works on numpy arrays as well as on tensors.
+        """
+        xp = np if isinstance(coefs, np.ndarray) else aet
+        broadcast = (slice(None),) + (None,) * (coefs.ndim - 1)
+
+        walk = xp.cumsum(self.scale[broadcast] * coefs, axis=0)
+        if self.direction is not None:
+            # the projection of ``_project_zerosum``, applied to the walk
+            walk = walk - self.direction[broadcast] * xp.tensordot(
+                self.direction, walk, axes=(0, 0)
+            )
+        return walk
+
+    def toarray(self) -> np.ndarray:
+        """The equivalent dense basis, in O(n²) memory."""
+        basis = np.tril(np.broadcast_to(self.scale, self.shape))
+        if self.direction is not None:
+            basis -= np.outer(self.direction, self.direction @ basis)
+        return basis
+
+
+def apply_gp_basis(basis: Union[np.ndarray, RandomWalkBasis], coefs):
+    """
+    Contract the basis functions of ``make_gp_basis`` with the coefficients
+    ``coefs``, whose first axis is that of the basis functions.
+    """
+    if isinstance(basis, RandomWalkBasis):
+        return basis.dot(coefs)
+    return aet.tensordot(basis, coefs, axes=(1, 0))
+
+
+def apply_gp_basis_at(
+    basis: Union[np.ndarray, RandomWalkBasis],
+    coefs,
+    rows,
+    batch,
+    n_batches: Optional[int] = None,
+):
+    """
+    ``apply_gp_basis(basis, coefs)[rows, :, batch]`` for coefficients of shape
+    ``(basis functions, series, batch)``, evaluated only at the pairs
+    ``(rows[i], batch[i])``.
+
+    The pairs are grouped by batch, and the rows of each group are contracted
+    with the coefficients of their batch, so that the cost scales with
+    ``len(rows)`` rather than with the size of the full ``(rows, series,
+    batch)`` result, and the coefficients are never copied per pair, nor
+    their gradient. ``n_batches``, the size of the last axis of ``coefs``, is
+    needed when ``coefs`` is a tensor. Works on numpy arrays as well as on
+    tensors.
+    """
+    if isinstance(coefs, np.ndarray):
+        result = None
+        for b in range(coefs.shape[2]):
+            pairs = np.flatnonzero(batch == b)
+            values = _apply_gp_basis_rows(basis, coefs[:, :, b], rows[pairs])
+            if result is None:
+                result = np.empty((len(rows),) + values.shape[1:], values.dtype)
+            result[pairs] = values
+        return result
+
+    if n_batches is None:
+        raise ValueError("`n_batches` is needed with tensor coefficients.")
+    rows, batch = aet.as_tensor_variable(rows), aet.as_tensor_variable(batch)
+    if not isinstance(basis, RandomWalkBasis):
+        basis = aet.as_tensor_variable(basis)
+    groups = []
+    for b in range(n_batches):
+        pairs = aet.eq(batch, b).nonzero()[0]
+        groups.append(
+            (pairs, _apply_gp_basis_rows(basis, coefs[:, :, b], rows[pairs]))
+        )
+    result = aet.zeros((rows.shape[0], coefs.shape[1]), dtype=groups[0][1].dtype)
+    for pairs, values in groups:
+        result = aet.set_subtensor(result[pairs], values)
+    return result
+
+
+def _apply_gp_basis_rows(basis: Union[np.ndarray, RandomWalkBasis], coefs, rows):
+    """``apply_gp_basis(basis, coefs)[rows]`` for coefficients of one batch."""
+    if isinstance(basis, RandomWalkBasis):
+        # the walk costs O(n) anyway
+        return basis.dot(coefs)[rows]
+    if isinstance(coefs, np.ndarray):
+        return basis[rows] @ coefs
+    return aet.dot(basis[rows], coefs)
+
+
+def _json_default(obj):
+    # arrays in full, as their ``str`` is abbreviated
+    return obj.tolist() if isinstance(obj, np.ndarray) else str(obj)
+
+
+class BasisCache:
+    """Memoize the GP bases computed by ``make_centered_gp_eigendecomp``.
 
-    return vecs[:, -n_eigs:] * np.sqrt(vals[-n_eigs:])
+    Bases are keyed by the time grid and the full GP configuration, and kept
+    in memory in a least-recently-used store. They can also be stored as
+    ``.npy`` files, which are shared by all the processes using the same
+    directory and survive across runs.
 
+    Parameters
+    ----------
+    maxsize
+        Number of bases kept in memory.
+    cache_dir
+        Directory of the bases stored on disk. Defaults to
+        ``POLLSPOSITION_BASIS_CACHE_DIR``; if it is not set either, the bases
+        are only cached in memory.
+    """
+
+    def __init__(self, maxsize: int = 32, cache_dir: Optional[Union[str, Path]] = None):
+        if cache_dir is None:
+            cache_dir = os.environ.get("POLLSPOSITION_BASIS_CACHE_DIR")
+
+        self.maxsize = maxsize
+        self.cache_dir = None if cache_dir is None else Path(cache_dir).expanduser()
+        self._bases = OrderedDict()
+
+    @staticmethod
+    def key(time: np.ndarray, gp_config: Dict) -> str:
+        """Hash of the time grid and of the GP configuration."""
+        time = np.ascontiguousarray(time)
+        params = {
+            "version": BASIS_CACHE_VERSION,
+            "dtype": str(time.dtype),
+            "shape": time.shape,
+            "gp_config": gp_config,
+        }
+        digest = hashlib.sha256(
+            json.dumps(params, sort_keys=True, default=_json_default).encode()
+        )
+        digest.update(time.tobytes())
+        return digest.hexdigest()[:20]
+
+    def get(self, time: np.ndarray, gp_config: Dict) -> np.ndarray:
+        """
+        The basis of ``make_centered_gp_eigendecomp(time, **gp_config)``,
+        computed only if it is in none of the stores. The returned array is
+        shared and read-only.
+        """
+        key = self.key(time, gp_config)
+        basis = self._bases.get(key)
+        if basis is None:
+            basis = self._load(key)
+            if basis is None:
+                basis = make_centered_gp_eigendecomp(time, **gp_config)
+                self._save(key, basis)
+            basis.setflags(write=False)
+            self._bases[key] = basis
+
+        self._bases.move_to_end(key)
+        while len(self._bases) > self.maxsize:
+            self._bases.popitem(last=False)
+        return basis
 
-def make_gp_basis(time, gp_config, key=None, *, model=None):
+    def clear(self):
+        """Empty the in-memory store; the bases stored on disk are kept."""
+        self._bases.clear()
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        if self.cache_dir is None:
+            return None
+        try:
+            return np.load(self.cache_dir / f"{key}.npy", allow_pickle=False)
+        except (OSError, ValueError):
+            # missing or truncated file
+            return None
+
+    def _save(self, key: str, basis: np.ndarray):
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / f"{key}.npy"
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, basis, allow_pickle=False)
+        os.replace(tmp, path)
+
+
+basis_cache = BasisCache()
+
+
+def make_gp_basis(
+    time, gp_config, key=None, *, model=None, cache: Optional[BasisCache] = None
+):
     model = pm.modelcontext(model)
 
     if gp_config is None:
@@ -169,7 +817,22 @@ def make_gp_basis(time, gp_config, key=None, *, model=None):
     ):
         gp_config["lengthscale"] = f"{gp_config['lengthscale'] * 7}D"
 
-    gp_basis_funcs = make_centered_gp_eigendecomp(time, **gp_config)
+    # the exact random walk, which is cheaper than any decomposition
+    if gp_config.get("method") == "statespace":
+        if gp_config["kernel"] != "randomwalk":
+            raise ValueError(
+                "The 'statespace' method is only available for the 'randomwalk' kernel."
+            )
+        gp_basis_funcs = RandomWalkBasis(
+            time,
+            zerosum=gp_config.get("zerosum", False),
+            a=gp_config.get("a"),
+            dtype=gp_config.get("dtype", "float64"),
+        )
+    else:
+        if cache is None:
+            cache = basis_cache
+        gp_basis_funcs = cache.get(time, gp_config)
     n_basis = gp_basis_funcs.shape[1]
     dim = f"gp_{key}_basis"
     model.add_coords({dim: pd.RangeIndex(n_basis)})
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import importlib
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+import numpy as np
+from utils._lazy import LazyModule, backend_module
+
+arviz = LazyModule("arviz")
+pm = LazyModule("pymc3")
+
+"""
+JAX backend of ``PresidentialElectionsModel.sample_all``.
+
+The log-density of a PyMC3 model is a graph of the backend's (Theano or Aesara)
+ops, which its JAX linker translates op by op into a JAX function. NUTS then
+runs in numpyro on that function, with all the chains vectorized with ``vmap``
+in a single process and compiled by XLA at once, instead of one process per
+chain each compiling its own C modules.
+
+The custom pieces of the model translate as follows: ``ZeroSumNormal`` and
+``ZeroSumTransform`` are built from standard tensor ops, and
+``DirichletMultinomialLogp``, whose ``perform`` is numpy code, gets the JAX
+implementation registered here.
+
+Requires ``jax`` and ``numpyro``.
+"""
+
+
+def _backend(module: str):
+    """``module`` of the backend PyMC3 runs on, e.g. ``"graph.fg"``."""
+    return importlib.import_module(f"{backend_module().__name__}.{module}")
+
+
+def _jax_funcify():
+    try:
+        return _backend("link.jax.jax_dispatch").jax_funcify
+    except ImportError:
+        # Aesara
+        return _backend("link.jax.dispatch").jax_funcify
+
+
+def dirichlet_multinomial_logp(logits, concentration, counts, n, mask):
+    """JAX implementation of the outputs of ``DirichletMultinomialLogp``."""
+    import jax
+    import jax.numpy as jnp
+    from jax.scipy.special import digamma, gammaln
+
+    mask = mask.astype(bool)
+    p = jnp.exp(jax.nn.log_softmax(jnp.where(mask, logits, -jnp.inf), axis=-1))
+    c = jnp.broadcast_to(concentration, n.shape)
+    # the terms of the zero counts vanish; a dummy concentration keeps their
+    # gradient finite
+    observed = counts > 0
+    a = jnp.where(observed, c[:, None] * p, 1.0)
+
+    logp = (
+        gammaln(n + 1.0)
+        - gammaln(counts + 1.0).sum(axis=-1)
+        + gammaln(c)
+        - gammaln(n + c)
+        + jnp.where(observed, gammaln(counts + a) - gammaln(a), 0).sum(-1)
+    )
+    logp = jnp.where((observed & ~mask).any(axis=-1), -jnp.inf, logp)
+
+    dlogp_da = jnp.where(observed, digamma(counts + a) - digamma(a), 0)
+    a_dlogp_da = jnp.where(observed, a, 0) * dlogp_da
+    dlogits = a_dlogp_da - p * a_dlogp_da.sum(axis=-1, keepdims=True)
+    dconcentration = digamma(c) - digamma(n + c) + (dlogp_da * p).sum(axis=-1)
+    return logp, dlogits, dconcentration
+
+
+@lru_cache(maxsize=None)
+def register_jax_ops():
+    """Register the JAX implementation of the custom ops of the model."""
+    from utils.dirichletmultinomial import DirichletMultinomialLogp
+
+    @_jax_funcify().register(DirichletMultinomialLogp)
+    def jax_funcify_DirichletMultinomialLogp(op, **kwargs):
+        return dirichlet_multinomial_logp
+
+
+def _replace_shared_variables(graphs: List):
+    """
+    The graphs with their shared variables, i.e. the data containers, replaced
+    by constants, which XLA can fold.
+    """
+    shared = [
+        var
+        for var in _backend("graph.basic").graph_inputs(graphs)
+        if isinstance(var, _backend("compile").SharedVariable)
+    ]
+    tensor = _backend("tensor")
+    return _backend("graph.basic").clone_replace(
+        graphs,
+        replace={
+            var: tensor.constant(var.get_value(borrow=True), name=var.name)
+            for var in shared
+        },
+    )
+
+
+def jaxify(inputs: List, outputs: List) -> Callable:
+    """
+    JAX function of ``inputs`` returning the list of ``outputs``, through a
+    translation of their graph.
+    """
+    register_jax_ops()
+    fgraph = _backend("graph.fg").FunctionGraph(
+        inputs, _replace_shared_variables(outputs), clone=True
+    )
+    fn = _jax_funcify()(fgraph)
+    if isinstance(fn, (list, tuple)):
+        # the JAX linker of Theano-PyMC returns one function per output
+        fns = fn
+        return lambda *args: [f(*args) for f in fns]
+
+    def wrapped(*args):
+        result = fn(*args)
+        return list(result) if isinstance(result, (list, tuple)) else [result]
+
+    return wrapped
+
+
+def sample_numpyro_nuts(
+    model: pm.Model,
+    draws: int = 1000,
+    tune: int = 1000,
+    chains: int = 4,
+    target_accept: float = 0.8,
+    random_seed: int = None,
+    dense_mass: bool = False,
+    progressbar: bool = True,
+) -> arviz.InferenceData:
+    """
+    Sample ``model`` with numpyro's NUTS, with the chains vectorized.
+
+    Each chain starts from the test point jittered by a uniform draw in
+    ``[-1, 1]``, like PyMC3's default initialization, and adapts its step size
+    and diagonal (or dense, with ``dense_mass``) mass matrix during ``tune``
+    draws.
+
+    Returns
+    -------
+    The posterior, with the deterministics and the untransformed variables
+    but not the transformed ones as ``arviz.from_pymc3`` does, and the sampler
+    statistics, with the coordinates and dimensions of the model.
+    """
+    import jax
+    from numpyro.infer import MCMC, NUTS
+
+    free_rvs = model.free_RVs
+    logp = jaxify(free_rvs, [model.logpt])
+
+    def potential(position):
+        return -logp(*position)[0]
+
+    if random_seed is None:
+        random_seed = np.random.randint(np.iinfo(np.int32).max)
+    rng = np.random.default_rng(random_seed)
+    init = [
+        model.test_point[rv.name]
+        + rng.uniform(-1, 1, size=(chains,) + model.test_point[rv.name].shape)
+        for rv in free_rvs
+    ]
+
+    mcmc = MCMC(
+        NUTS(
+            potential_fn=potential,
+            target_accept_prob=target_accept,
+            dense_mass=dense_mass,
+        ),
+        num_warmup=tune,
+        num_samples=draws,
+        num_chains=chains,
+        chain_method="vectorized",
+        progress_bar=progressbar,
+    )
+    mcmc.run(
+        jax.random.PRNGKey(random_seed),
+        init_params=init,
+        extra_fields=("diverging", "energy", "num_steps", "potential_energy"),
+    )
+    samples = mcmc.get_samples(group_by_chain=True)
+    stats = mcmc.get_extra_fields(group_by_chain=True)
+
+    recorded = [
+        var
+        for var in model.unobserved_RVs
+        if not pm.util.is_transformed_name(var.name)
+    ]
+    posterior = _deterministics(jaxify(free_rvs, recorded), samples, recorded)
+
+    return arviz.from_dict(
+        posterior=posterior,
+        sample_stats={
+            "diverging": np.asarray(stats["diverging"]),
+            "energy": np.asarray(stats["energy"]),
+            "tree_size": np.asarray(stats["num_steps"]),
+            "lp": -np.asarray(stats["potential_energy"]),
+        },
+        coords=model.coords,
+        dims=model.RV_dims,
+    )
+
+
+def _deterministics(fn: Callable, samples: List, variables: List) -> Dict:
+    """
+    Values of ``variables`` at each draw of ``samples``, vectorized over the
+    draws and computed one chain at a time to bound the memory.
+    """
+    import jax
+
+    batched = jax.jit(jax.vmap(fn))
+    per_chain = [
+        batched(*(sample[chain] for sample in samples))
+        for chain in range(samples[0].shape[0])
+    ]
+    return {
+        var.name: np.stack([np.asarray(values[i]) for values in per_chain])
+        for i, var in enumerate(variables)
+    }
@@ -1,19 +1,28 @@
+from __future__ import annotations
+
+import io
 import json
-from typing import Dict, List, Tuple
-from urllib.request import urlopen
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
 
-import arviz
 import numpy as np
-import pandas as pd
-import pymc3 as pm
-from utils.gpapproximation import make_gp_basis
-from utils.zerosumnormal import ZeroSumNormal
-
-# Aesara will replace Theano in PyMC 4.0
-if pm.math.erf.__module__.split(".")[0] == "theano":
-    import theano.tensor as aet
-else:
-    import aesara.tensor as aet
+from utils._lazy import LazyModule, tensor_module
+from utils.datasources import SOURCES, DataCache
+from utils.gpapproximation import apply_gp_basis, apply_gp_basis_at, make_gp_basis
+
+# The PPL stack and pandas are only imported when first used, so that importing
+# this module and building a ``PresidentialElectionsModel`` stays cheap.
+arviz = LazyModule("arviz")
+pd = LazyModule("pandas")
+pm = LazyModule("pymc3")
+aet = LazyModule("aet", loader=tensor_module)
+jaxsampling = LazyModule("utils.jaxsampling")
+posteriorpredictive = LazyModule("utils.posteriorpredictive")
+snapshot = LazyModule("utils.snapshot")
+warmstart = LazyModule("utils.warmstart")
+zarrtrace = LazyModule("utils.zarrtrace")
+xr = LazyModule("xarray")
 
 
 def dates_to_idx(timelist, reference_date):
@@ -27,6 +36,28 @@ def standardize(series):
     return (series - series.mean()) / series.std()
 
 
+class _PreparedData:
+    """
+    Attribute produced by the data preparation pipeline, which runs the first
+    time one of these attributes is accessed.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if instance.__dict__.get("_preparing", False):
+            raise AttributeError(
+                f"{self.name} is accessed before it is set in the data preparation."
+            )
+        instance._prepare_data()
+        # ``_prepare_data`` sets the instance attribute, which from now on
+        # shadows this descriptor
+        return instance.__dict__[self.name]
+
+
 class PresidentialElectionsModel:
     """A model for the French 2022 presidential elections.
 
@@ -61,12 +92,23 @@ class PresidentialElectionsModel:
         "other",
     ]
 
+    # Fundamentals, i.e. the continuous predictors of the election results, by
+    # name. ``source`` is a key of ``SOURCES`` or a path relative to the data
+    # repository, ``freq`` is the period covered by each value (``"M"``,
+    # ``"Q"``...) and the remaining keys are passed to ``_load_generic_predictor``.
+    fundamentals = {
+        "unemployment": {"source": "unemployment", "freq": "Q", "skiprows": 2},
+    }
+
     def __init__(
         self,
         election_date: str,
         timescales: List[int] = [5, 14, 28],
         weights: List[float] = None,
         test_cutoff: pd.Timedelta = None,
+        data_cache: DataCache = None,
+        snapshot_dir: str = None,
+        fundamentals: Dict[str, Dict] = None,
     ):
         """
         Initialize the model builder.
@@ -86,9 +128,31 @@ class PresidentialElectionsModel:
             How much of the dataset for ``election_to_predict`` we want to cut to test the model.
             If 2 months for instance, the last two months of polls in the campaign won't be fed to
             the model.
+        data_cache
+            Where the remote data sources are fetched from. Defaults to a
+            ``DataCache`` configured from the environment, which only goes to
+            the network when its cached copies are stale.
+        snapshot_dir
+            Directory of prepared-data snapshots. If the snapshot matching the
+            current raw inputs, ``election_date`` and ``test_cutoff`` is there,
+            the prepared data is loaded from it and the whole data pipeline is
+            skipped; otherwise the pipeline runs and the snapshot is written.
+        fundamentals
+            The continuous predictors to use, in the format of the
+            ``fundamentals`` class attribute, which is the default.
         """
 
-        self.gp_config = {
+        self.election_date = election_date
+        self.test_cutoff = test_cutoff
+        self.data_cache = data_cache if data_cache is not None else DataCache()
+        self.snapshot_dir = snapshot_dir
+        if fundamentals is not None:
+            self.fundamentals = fundamentals
+        self.gp_config = self._make_gp_config(timescales, weights)
+
+    @staticmethod
+    def _make_gp_config(timescales: List[int], weights: List[float]) -> Dict:
+        return {
             "lengthscale": timescales,
             "kernel": "gaussian",
             "zerosum": True,
@@ -96,18 +160,148 @@ class PresidentialElectionsModel:
             "variance_weight": weights,
         }
 
+    # Attributes produced by ``_prepare_data`` and stored in snapshots. They
+    # are computed the first time one of them is accessed.
+    _prepared_attributes = [
+        "polls_train",
+        "polls_test",
+        "results_raw",
+        "results_mult",
+        "results_oos",
+        "hypotheses_2022",
+        "unique_elections",
+        "unique_pollsters",
+        "fundamentals_data",
+        "continuous_predictors",
+        "results_preds",
+        "campaign_preds",
+    ]
+    polls_train = _PreparedData()
+    polls_test = _PreparedData()
+    results_raw = _PreparedData()
+    results_mult = _PreparedData()
+    results_oos = _PreparedData()
+    hypotheses_2022 = _PreparedData()
+    unique_elections = _PreparedData()
+    unique_pollsters = _PreparedData()
+    fundamentals_data = _PreparedData()
+    continuous_predictors = _PreparedData()
+    results_preds = _PreparedData()
+    campaign_preds = _PreparedData()
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        path: str,
+        timescales: List[int] = [5, 14, 28],
+        weights: List[float] = None,
+        data_cache: DataCache = None,
+    ) -> "PresidentialElectionsModel":
+        """
+        Initialize the model builder from a snapshot written by ``save_snapshot``,
+        without looking at the raw data sources at all.
+        """
+        self = cls.__new__(cls)
+        self.data_cache = data_cache if data_cache is not None else DataCache()
+        self.snapshot_dir = None
+        self.gp_config = self._make_gp_config(timescales, weights)
+        self._load_prepared_data(Path(path))
+        return self
+
+    def snapshot_key(self) -> str:
+        """Hash of the raw inputs and of the parameters of the data preparation."""
+        return snapshot.snapshot_key(
+            sources={name: self.data_cache.digest(name) for name in self._sources()},
+            election_date=self.election_date,
+            test_cutoff=self.test_cutoff,
+            political_families=self.political_families,
+            fundamentals=self.fundamentals,
+            attributes=self._prepared_attributes,
+        )
+
+    def save_snapshot(self, path: str):
+        """Save the prepared data as a memory-mappable columnar snapshot."""
+        snapshot.save_snapshot(
+            path,
+            {attr: getattr(self, attr) for attr in self._prepared_attributes},
+            attrs={
+                "election_date": str(self.election_date),
+                "test_cutoff": (
+                    None
+                    if self.test_cutoff is None
+                    else str(pd.Timedelta(self.test_cutoff))
+                ),
+                "fundamentals": self.fundamentals,
+            },
+        )
+
+    def memory_usage(self) -> pd.Series:
+        """Memory used by each of the prepared attributes, in bytes."""
+        return pd.Series(
+            {
+                attr: np.sum(getattr(self, attr).memory_usage(deep=True))
+                for attr in self._prepared_attributes
+            },
+            name="bytes",
+        )
+
+    def _load_prepared_data(self, path: Path):
+        frames, attrs = snapshot.load_snapshot(path)
+        for attr in self._prepared_attributes:
+            setattr(self, attr, frames[attr])
+        self.election_date = attrs["election_date"]
+        self.test_cutoff = (
+            None if attrs["test_cutoff"] is None else pd.Timedelta(attrs["test_cutoff"])
+        )
+        self.fundamentals = attrs["fundamentals"]
+
+    def _sources(self) -> List[str]:
+        """The data sources the prepared data is computed from."""
+        return list(
+            dict.fromkeys(
+                ["old_polls", "polls_2022", "results"]
+                + [spec["source"] for spec in self.fundamentals.values()]
+            )
+        )
+
+    def _prepare_data(self):
+        """
+        Compute the prepared data, from the snapshot in ``snapshot_dir`` if it
+        is there.
+        """
+        self._preparing = True
+        try:
+            if self.snapshot_dir is None:
+                self._run_data_pipeline()
+                return
+
+            path = Path(self.snapshot_dir) / self.snapshot_key()
+            if (path / "meta.json").exists():
+                self._load_prepared_data(path)
+            else:
+                self._run_data_pipeline()
+                self.save_snapshot(path)
+        finally:
+            self._preparing = False
+
+    def _run_data_pipeline(self):
+        """Load the raw data sources and run the whole data preparation pipeline."""
+        # the sources are independent: download them all at once before the
+        # CPU-bound stages
+        self.data_cache.prefetch(self._sources())
+
         polls = self._load_polls()
         (
             self.polls_train,
             self.polls_test,
             self.results_raw,
             self.results_mult,
-        ) = self._clean_polls(polls, test_cutoff)
+        ) = self._clean_polls(polls, self.test_cutoff)
 
         _, self.unique_elections = self.polls_train["dateelection"].factorize()
         _, self.unique_pollsters = self.polls_train["sondage"].factorize()
         self.results_oos = self.results_mult[
-            self.results_mult.dateelection != election_date
+            self.results_mult.dateelection != self.election_date
         ].copy()
 
         self._load_predictors()
@@ -115,6 +309,7 @@ class PresidentialElectionsModel:
             self.results_preds,
             self.campaign_preds,
         ) = self._standardize_continuous_predictors()
+        self._compact_schema()
 
     def _load_polls(self) -> pd.DataFrame:
         old_polls = self._load_old_polls()
@@ -136,11 +331,9 @@ class PresidentialElectionsModel:
 
         return polls.reset_index()
 
-    @staticmethod
-    def _load_old_polls() -> pd.DataFrame:
+    def _load_old_polls(self) -> pd.DataFrame:
         polls = pd.read_csv(
-            "https://raw.githubusercontent.com/pollsposition/data/main/sondages"
-            "/tour1_complet_unitedfl.csv",
+            io.BytesIO(self.data_cache.fetch(SOURCES["old_polls"])),
             index_col=0,
             parse_dates=["dateelection", "date"],
         )
@@ -163,60 +356,102 @@ class PresidentialElectionsModel:
         ).reset_index(drop=True)
 
     def _load_2022_polls(self) -> pd.DataFrame:
-        url = "https://raw.githubusercontent.com/pollsposition/data/main/sondages/presidentielles_2022.json"
-        response = urlopen(url)
-        raw_polls = json.loads(response.read())
-        new_polls = self._clean_up_json(raw_polls)
+        raw_polls = json.loads(self.data_cache.fetch(SOURCES["polls_2022"]))
+        self.hypotheses_2022 = self._flatten_polls_json(raw_polls)
+        new_polls = self._clean_up_json(self.hypotheses_2022)
         return self._format_2022_polls(new_polls)
 
-    def _clean_up_json(self, raw_polls: pd.DataFrame) -> pd.DataFrame:
-        metadata = [
-            pd.json_normalize(raw_polls["sondages"][poll])[
-                ["institut", "date_debut", "date_fin", "premier_tour"]
-            ]
-            for poll in raw_polls["sondages"].keys()
-        ]
-        metadata = pd.concat(metadata).sort_values("date_debut")
-        metadata[["date_debut", "date_fin"]] = metadata[
-            ["date_debut", "date_fin"]
-        ].apply(pd.to_datetime)
-        metadata = metadata[metadata.date_debut >= "2022-01-01"].reset_index(drop=True)
+    @staticmethod
+    def _flatten_polls_json(raw_polls: Dict) -> pd.DataFrame:
+        """
+        Flatten every first-round hypothesis of every poll in a single pass.
 
-        polls_temp = []
-        for _, row in metadata.iterrows():
-            poll = row["premier_tour"]
-            polls_temp.append(self.select_hypothesis(poll))
-        polls_temp = pd.concat(polls_temp).reset_index(drop=True)
+        Returns one row per hypothesis, indexed by the poll's key in
+        ``raw_polls["sondages"]`` and the rank of the hypothesis within the
+        poll, with the poll's metadata, the hypothesis' sample size and one
+        column of voting intentions per candidate (NaN when the candidate is
+        not part of the hypothesis).
+        """
+        polls, ranks = [], []
+        metadata = {
+            "institut": [],
+            "date_debut": [],
+            "date_fin": [],
+            "hypothese": [],
+            "intentions_exprimees": [],
+        }
+        rows, candidates, intentions = [], [], []
+
+        for key, poll in raw_polls["sondages"].items():
+            for rank, hypothesis in enumerate(poll["premier_tour"]):
+                row = len(polls)
+                polls.append(key)
+                ranks.append(rank)
+                for field in ("institut", "date_debut", "date_fin"):
+                    metadata[field].append(poll[field])
+                metadata["hypothese"].append(hypothesis.get("hypothese"))
+                metadata["intentions_exprimees"].append(
+                    hypothesis.get("intentions_exprimees")
+                )
+                for candidate, intention in hypothesis["intentions"].items():
+                    rows.append(row)
+                    candidates.append(candidate)
+                    intentions.append(intention)
 
-        # exclude certitude
-        new_polls = pd.concat([metadata, polls_temp], axis=1).drop(
-            ["premier_tour", "base", "nspp", "hypothese"], axis=1
+        candidate_idx, candidate_names = pd.factorize(
+            np.asarray(candidates, dtype=object)
+        )
+        values = np.full((len(polls), len(candidate_names)), np.nan)
+        values[rows, candidate_idx] = np.asarray(intentions, dtype=float)
+
+        index = pd.MultiIndex.from_arrays([polls, ranks], names=["poll", "hypothesis"])
+        metadata = pd.DataFrame(metadata, index=index)
+        metadata["date_debut"] = pd.to_datetime(metadata["date_debut"])
+        metadata["date_fin"] = pd.to_datetime(metadata["date_fin"])
+        # both fields are missing from some hypotheses; snapshots can't store
+        # missing Python objects
+        metadata["hypothese"] = metadata["hypothese"].fillna("").astype(str)
+        metadata["intentions_exprimees"] = metadata["intentions_exprimees"].astype(
+            float
+        )
+
+        return pd.concat(
+            [metadata, pd.DataFrame(values, index=index, columns=candidate_names)],
+            axis=1,
         )
-        return new_polls.drop(new_polls.filter(regex="certitude.").columns, axis=1)
 
     @staticmethod
-    def select_hypothesis(poll: List) -> pd.DataFrame:
+    def _clean_up_json(hypotheses: pd.DataFrame) -> pd.DataFrame:
         """
-        Select hypothesis with Taubira when present.
-        Just return poll otherwise.
+        Keep one hypothesis per 2022 poll: the first one with Taubira when
+        present, the last one otherwise.
         """
-        for hypothesis in poll:
-            intentions = hypothesis["intentions"]
-            if "Christiane Taubira" in intentions.keys():
-                # this return assumes there is only one Taubira hypothesis
-                return pd.json_normalize(hypothesis)
-        return pd.json_normalize(hypothesis)
+        hypotheses = hypotheses[hypotheses["date_debut"] >= "2022-01-01"]
+        poll_idx, _ = hypotheses.index.get_level_values("poll").factorize()
+        rank = hypotheses.index.get_level_values("hypothesis").to_numpy()
+        if "Christiane Taubira" in hypotheses:
+            with_taubira = hypotheses["Christiane Taubira"].notna().to_numpy()
+        else:
+            with_taubira = np.zeros(len(hypotheses), dtype=bool)
+
+        # within each poll, Taubira hypotheses come first, in order, then the
+        # other ones, last one first
+        order = np.lexsort(
+            (np.where(with_taubira, rank, -rank), ~with_taubira, poll_idx)
+        )
+        _, first = np.unique(poll_idx[order], return_index=True)
+
+        return (
+            hypotheses.iloc[order[first]]
+            .sort_values("date_debut", kind="mergesort")
+            .drop("hypothese", axis=1)
+            .dropna(axis=1, how="all")
+            .reset_index(drop=True)
+        )
 
     @staticmethod
     def _format_2022_polls(new_polls: pd.DataFrame) -> pd.DataFrame:
 
-        # different renames
-        to_rename = new_polls.filter(regex="intentions\.").columns
-        new_names = (
-            new_polls.filter(regex="intentions\.")
-            .columns.str.split(".", expand=True)
-            .droplevel(0)
-        )
         AFFILIATIONS = {
             "Jean-Luc Mélenchon": "nbfarleft",
             "Anne Hidalgo": "nbleft",
@@ -227,16 +462,12 @@ class PresidentialElectionsModel:
             "Éric Zemmour": "nbsouverainistes",
         }
 
-        new_polls = (
-            new_polls.rename(
-                columns=(
-                    {"institut": "sondage", "intentions_exprimees": "samplesize"}
-                    | dict(zip(to_rename, new_names))
-                )
+        new_polls = new_polls.rename(
+            columns=(
+                {"institut": "sondage", "intentions_exprimees": "samplesize"}
+                | AFFILIATIONS
             )
-            .rename(columns=AFFILIATIONS)
-            .replace({"Harris interactive": "Harris", "Opinionway": "OpinionWay"})
-        )
+        ).replace({"Harris interactive": "Harris", "Opinionway": "OpinionWay"})
 
         # compute median date
         new_polls["date"] = pd.to_datetime(
@@ -276,46 +507,59 @@ class PresidentialElectionsModel:
     def _format_polls(
         self, polls: pd.DataFrame, parties_complete: List[str]
     ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        results_raw, polls = self._format_poll_rows(polls, parties_complete)
+
+        # cast results as multinomial
+        results_mult = self.results_as_multinomial(results_raw)
+
+        return results_raw, results_mult, polls
+
+    def _format_poll_rows(
+        self, polls: pd.DataFrame, parties_complete: List[str]
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
         # start all elections on Jan 1st
-        dfs = []
-        for date in polls.dateelection.unique():
-            date = pd.to_datetime(date)
-            df = polls[(polls.dateelection == date) & (polls.date >= f"{date.year}-01")]
-            df["countdown"] = dates_to_idx(df["date"], reference_date=date).astype(int)
-            dfs.append(df)
+        election = polls["dateelection"].to_numpy(dtype="datetime64[ns]")
+        date = polls["date"].to_numpy(dtype="datetime64[ns]")
+        in_campaign = date >= election.astype("datetime64[Y]")
+        polls = polls[in_campaign]
+        election, date = election[in_campaign], date[in_campaign]
 
         # compute "other" category
-        polls = (
-            pd.concat(dfs)
-            .set_index(["dateelection", "date", "countdown", "sondage", "samplesize"])
-            .rename(
-                columns={
-                    col: col.split("nb")[1] for col in polls if col.startswith("nb")
-                }
-            )[parties_complete[:-1]]
+        shares = polls[["nb" + party for party in parties_complete[:-1]]].to_numpy(
+            dtype=float
+        )
+        shares = np.column_stack([shares, 100 - np.nansum(shares, axis=1)])
+        np.testing.assert_allclose(np.nansum(shares, axis=1), 100)
+
+        polls = pd.DataFrame(
+            {
+                "dateelection": election,
+                "date": date,
+                "countdown": dates_to_idx(date, reference_date=election).astype(int),
+                "sondage": polls["sondage"].to_numpy(),
+                "samplesize": polls["samplesize"].to_numpy(),
+            }
+            | dict(zip(parties_complete, shares.T))
         )
-        polls["other"] = 100 - polls.sum(1)
-        np.testing.assert_allclose(polls.sum(1).values, 100)
 
         # isolate results
-        polls = polls.reset_index()
-        results_raw = polls[polls.sondage == "result"]
-        polls = polls[polls.sondage != "result"].set_index(["date", "sondage"])
+        is_result = polls["sondage"].to_numpy() == "result"
+        results_raw = polls[is_result]
+        polls = polls[~is_result].reset_index(drop=True)
 
         # cast polls as multinomial obs
-        polls = self.cast_as_multinomial(polls)
-
-        # cast results as multinomial
-        results_mult = self.results_as_multinomial(results_raw)
+        counts = self._as_counts(shares[~is_result], polls["samplesize"].to_numpy())
+        polls[parties_complete] = counts
+        polls["samplesize"] = counts.sum(1)
+        polls = polls[
+            ["date", "sondage"] + list(polls.columns.drop(["date", "sondage"]))
+        ]
 
-        return results_raw, results_mult, polls.reset_index()
+        return results_raw, polls
 
     def results_as_multinomial(self, results_raw: pd.DataFrame) -> pd.DataFrame:
         # need number of people who voted
-        raw_json = pd.read_json(
-            "https://raw.githubusercontent.com/pollsposition/data/main/resultats/presidentielles"
-            ".json",
-        )
+        raw_json = pd.read_json(io.BytesIO(self.data_cache.fetch(SOURCES["results"])))
         raw_json = raw_json.loc["premier_tour"].to_dict()
 
         jsons = []
@@ -343,17 +587,21 @@ class PresidentialElectionsModel:
         return self.cast_as_multinomial(results_mult)
 
     def cast_as_multinomial(self, df: pd.DataFrame) -> pd.DataFrame:
-        df[self.political_families] = (
-            (df[self.political_families] / 100)
-            .mul(df["samplesize"], axis=0)
-            .round()
-            .fillna(0)
-            .astype(int)
+        counts = self._as_counts(
+            df[self.political_families].to_numpy(dtype=float),
+            df["samplesize"].to_numpy(),
         )
-        df["samplesize"] = df[self.political_families].sum(1)
+        df[self.political_families] = counts
+        df["samplesize"] = counts.sum(1)
 
         return df
 
+    @staticmethod
+    def _as_counts(shares: np.ndarray, samplesize: np.ndarray) -> np.ndarray:
+        """Turn percentages into counts, treating missing values as 0."""
+        counts = np.round(shares / 100 * samplesize.astype(float)[:, None])
+        return np.nan_to_num(counts).astype(int)
+
     @staticmethod
     def _train_split(
         polls: pd.DataFrame, test_cutoff: pd.Timedelta = None
@@ -375,37 +623,81 @@ class PresidentialElectionsModel:
         return polls_train, polls_test
 
     def _load_predictors(self):
-        self.unemployment_data = self._load_generic_predictor(
-            "https://raw.githubusercontent.com/pollsposition/data/main/predicteurs"
-            "/chomage_national_trim.csv",
-            name="unemployment",
-            freq="Q",
-            skiprows=2,
-        )
-        self.polls_train, self.polls_test, self.results_mult = self._merge_with_data(
-            self.unemployment_data, freq="Q"
+        self.fundamentals_data = self._combine_predictors(
+            [
+                self._load_generic_predictor(
+                    io.BytesIO(self.data_cache.fetch(spec["source"])),
+                    name=name,
+                    **{key: value for key, value in spec.items() if key != "source"},
+                )
+                for name, spec in self.fundamentals.items()
+            ]
         )
+        self._merge_with_data()
         return
 
-    def _merge_with_data(
-        self, predictor: pd.DataFrame, freq: str
-    ) -> List[pd.DataFrame]:
-        polls_train = self.polls_train.copy()
-        polls_test = self.polls_test.copy()
-        results_mult = self.results_mult.copy()
-        dfs = []
+    def _merge_with_data(self):
+        """Add the value of every fundamental at the date of each poll and result."""
+        names = list(self.fundamentals)
+        for data in [self.polls_train, self.polls_test, self.results_mult]:
+            data[names] = self._align_fundamentals(data["date"])
+            data.reset_index(drop=True, inplace=True)
+
+    @staticmethod
+    def _combine_predictors(predictors: List[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Put predictors of different frequencies on a common grid of dates.
 
-        for data in [polls_train, polls_test, results_mult]:
-            # add freq to data
-            data.index = data["date"].dt.to_period(freq)
-            # merge with data
-            dfs.append(data.join(predictor).reset_index(drop=True))
+        The grid is the start of every period of every predictor, and each row
+        holds the value of each predictor over the period containing that date.
+        The end of the last period of each predictor is on the grid too, and
+        the predictor is missing from there on, so that the value of all the
+        predictors at any date is the row of the last grid date before it.
+        """
+        ends = [(predictor.index[-1] + 1).start_time for predictor in predictors]
+        starts = pd.DatetimeIndex(
+            np.unique(
+                np.concatenate(
+                    [predictor.index.start_time.to_numpy() for predictor in predictors]
+                    + [pd.DatetimeIndex(ends).to_numpy()]
+                )
+            ),
+            name="date",
+        )
+        return pd.DataFrame(
+            {
+                name: predictor[name]
+                .reindex(starts.to_period(predictor.index.freq))
+                .to_numpy()
+                for predictor in predictors
+                for name in predictor.columns
+            },
+            index=starts,
+        )
 
-        return dfs
+    def _align_fundamentals(self, dates: Union[pd.Series, pd.Index]) -> np.ndarray:
+        """
+        Values of all the fundamentals at ``dates``, as a ``(len(dates),
+        len(fundamentals))`` array, found with one binary search in the grid of
+        ``fundamentals_data``.
+        """
+        rows = (
+            self.fundamentals_data.index.searchsorted(
+                pd.DatetimeIndex(dates), side="right"
+            )
+            - 1
+        )
+        # dates before the grid get row -1, i.e. the last row, which is missing
+        # values like the dates after the last period
+        return self.fundamentals_data.to_numpy()[rows]
 
     @staticmethod
     def _load_generic_predictor(
-        file: str, name: str, freq: str, skiprows: int, sep: str = ";"
+        file: Union[str, io.BytesIO],
+        name: str,
+        freq: str,
+        skiprows: int,
+        sep: str = ";",
     ) -> pd.DataFrame:
 
         data = pd.read_csv(
@@ -425,9 +717,7 @@ class PresidentialElectionsModel:
 
     def _standardize_continuous_predictors(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """Substract mean and divide by std to help with sampling and setting priors."""
-        continuous_predictors = [
-            "unemployment",
-        ]
+        continuous_predictors = list(self.fundamentals)
         self.continuous_predictors = (
             pd.concat(
                 [
@@ -447,10 +737,217 @@ class PresidentialElectionsModel:
             ],
         )
 
+    def _compact_schema(self):
+        """
+        Cast the prepared poll and result frames to the compact schema of
+        ``_as_schema``, with pollster and election categories shared by all the
+        frames.
+        """
+        frames = [
+            self.polls_train,
+            self.polls_test,
+            self.results_mult,
+            self.results_oos,
+        ]
+        pollsters = pd.CategoricalDtype(
+            sorted(set().union(*(data["sondage"] for data in frames)))
+        )
+        elections = pd.CategoricalDtype(self.unique_elections, ordered=True)
+        (
+            self.polls_train,
+            self.polls_test,
+            self.results_mult,
+            self.results_oos,
+        ) = (self._as_schema(data, pollsters, elections) for data in frames)
+
+    def _as_schema(
+        self,
+        data: pd.DataFrame,
+        pollsters: pd.CategoricalDtype,
+        elections: pd.CategoricalDtype,
+    ) -> pd.DataFrame:
+        """
+        Copy of ``data`` with only the columns used downstream, in compact
+        dtypes: categorical pollsters and elections, which ``_build_coords``
+        turns into coordinates without factorizing them, int16 countdown and
+        int32 counts.
+        """
+        columns = {
+            "date": data["date"].to_numpy(dtype="datetime64[ns]"),
+            "sondage": pd.Categorical(data["sondage"], dtype=pollsters),
+            "dateelection": pd.Categorical(data["dateelection"], dtype=elections),
+            "countdown": data["countdown"].to_numpy(dtype=np.int16),
+            "samplesize": data["samplesize"].to_numpy(dtype=np.int32),
+        }
+        for party in self.political_families:
+            columns[party] = data[party].to_numpy(dtype=np.int32)
+        for name in self.fundamentals:
+            if name in data:
+                columns[name] = data[name].to_numpy(dtype=np.float64)
+
+        return pd.DataFrame(columns, index=data.index)
+
+    def add_polls(self, polls: pd.DataFrame) -> Dict[str, pd.Index]:
+        """
+        Append new polls to the prepared data, with work proportional to the
+        number of new polls.
+
+        The polls are cast as multinomial observations and joined with the
+        predictors, and the polls of ``election_date`` go to ``polls_test``
+        if they are after the test cutoff, as in ``__init__``. The moments of
+        the continuous predictors are updated with the new values only, and
+        the standardized predictors are shifted and rescaled accordingly.
+
+        Parameters
+        ----------
+        polls
+            New polls, in the format of the data sources: their ``date``,
+            ``sondage`` and ``samplesize``, the percentage of each political
+            family in ``nb<family>`` columns and optionally ``dateelection``,
+            which defaults to ``election_date``.
+
+        Returns
+        -------
+        The coordinate values that were added, by dimension: ``observations``
+        (the new rows of ``polls_train``), ``pollsters`` and ``countdown``.
+        Empty indexes mean that the dimension did not change.
+        """
+        polls = polls.copy()
+        if "dateelection" not in polls:
+            polls["dateelection"] = self.election_date
+        polls["date"] = pd.to_datetime(polls["date"])
+        polls["dateelection"] = pd.to_datetime(polls["dateelection"])
+        for party in self.political_families[:-1]:
+            if f"nb{party}" not in polls:
+                polls[f"nb{party}"] = 0.0
+
+        unknown_elections = set(polls["dateelection"]).difference(self.unique_elections)
+        if unknown_elections:
+            raise ValueError(
+                f"Polls for elections {sorted(unknown_elections)} can't be added: "
+                "only elections already in the model are supported."
+            )
+
+        _, polls = self._format_poll_rows(polls, self.political_families)
+        polls[list(self.fundamentals)] = self._align_fundamentals(polls["date"])
+
+        last_election = pd.to_datetime(self.election_date)
+        test_cutoff = last_election - (
+            self.test_cutoff if self.test_cutoff else pd.Timedelta(2, "D")
+        )
+        is_test = (polls["dateelection"] == last_election) & (
+            polls["date"] > test_cutoff
+        )
+        new_train = polls[~is_test]
+        new_test = polls[is_test]
+        new_train.index = pd.RangeIndex(len(new_train)) + len(self.polls_train)
+        new_test.index = pd.RangeIndex(len(new_test)) + len(self.polls_test)
+
+        max_countdown = self.polls_train["countdown"].max()
+        changes = {
+            "observations": new_train.index,
+            "pollsters": pd.Index(new_train["sondage"].unique()).difference(
+                self.unique_pollsters, sort=False
+            ),
+            "countdown": pd.RangeIndex(
+                max_countdown + 1,
+                np.max(new_train["countdown"].to_numpy(), initial=max_countdown) + 1,
+            ),
+        }
+        if new_train.empty and new_test.empty:
+            return changes
+
+        self._update_continuous_predictors(
+            new_train[["date"] + list(self.fundamentals)]
+        )
+
+        # new pollsters are inserted in the shared categories, which stay sorted
+        pollsters = self.polls_train["sondage"].dtype
+        if not set(polls["sondage"]).issubset(pollsters.categories):
+            pollsters = pd.CategoricalDtype(
+                pollsters.categories.union(polls["sondage"].unique())
+            )
+            for attr in ["polls_train", "polls_test", "results_mult", "results_oos"]:
+                data = getattr(self, attr)
+                data["sondage"] = data["sondage"].cat.set_categories(
+                    pollsters.categories
+                )
+        elections = self.polls_train["dateelection"].dtype
+        self.polls_train = pd.concat(
+            [self.polls_train, self._as_schema(new_train, pollsters, elections)]
+        )
+        self.polls_test = pd.concat(
+            [self.polls_test, self._as_schema(new_test, pollsters, elections)]
+        )
+        self.unique_pollsters = self.unique_pollsters.append(changes["pollsters"])
+
+        return changes
+
+    def refresh(self) -> Dict[str, pd.Index]:
+        """
+        Fetch the 2022 polls again and add the ones that are not in the model yet.
+
+        Returns
+        -------
+        The coordinate values that were added, as in ``add_polls``.
+        """
+        raw_polls = json.loads(self.data_cache.fetch(SOURCES["polls_2022"]))
+        known = set(self.hypotheses_2022.index.get_level_values("poll"))
+        raw_polls["sondages"] = {
+            key: poll for key, poll in raw_polls["sondages"].items() if key not in known
+        }
+        if not raw_polls["sondages"]:
+            return self.add_polls(
+                pd.DataFrame(columns=["date", "sondage", "samplesize"])
+            )
+
+        hypotheses = self._flatten_polls_json(raw_polls)
+        self.hypotheses_2022 = pd.concat([self.hypotheses_2022, hypotheses])
+        new_polls = self._format_2022_polls(self._clean_up_json(hypotheses))
+
+        return self.add_polls(new_polls)
+
+    def _update_continuous_predictors(self, new_values: pd.DataFrame):
+        """
+        Add the predictors of new polls, updating the standardization with the
+        moments of the new values only.
+        """
+        new_values = new_values.set_index("date")
+        if new_values.empty:
+            return
+        old = self.continuous_predictors
+        n_old, n_new = len(old), len(new_values)
+        # pooled mean and unbiased variance, as in ``standardize``
+        mean_old, var_old = old.mean(), old.var()
+        mean_new = new_values.mean()
+        var_new = new_values.var(ddof=0).fillna(0)
+        n = n_old + n_new
+        mean = (n_old * mean_old + n_new * mean_new) / n
+        var = (
+            (n_old - 1) * var_old
+            + n_new * var_new
+            + n_old * n_new / n * (mean_new - mean_old) ** 2
+        ) / (n - 1)
+
+        # the standardized predictors are an affine map of the raw ones
+        scale, shift = np.sqrt(var_old / var), (mean_old - mean) / np.sqrt(var)
+        self.results_preds = self.results_preds * scale + shift
+        self.campaign_preds = pd.concat(
+            [
+                self.campaign_preds * scale + shift,
+                (new_values - mean) / np.sqrt(var),
+            ]
+        )
+        self.continuous_predictors = pd.concat([old, new_values])
+
     def build_model(
         self,
         polls: pd.DataFrame = None,
         continuous_predictors: pd.DataFrame = None,
+        sparse_time_effects: bool = False,
+        batch_size: int = None,
+        deterministics: List[str] = None,
+        observations: np.ndarray = None,
     ) -> pm.Model:
         """Build and return a pymc3 model for the poll results and fundamental data.
 
@@ -464,12 +961,53 @@ class PresidentialElectionsModel:
             Continuous predictors, or fundamentals. This only need to be
             specified for out-of-sample predictions to run the model on another
             dataset than the training data.
+        sparse_time_effects
+            Only evaluate the election-specific time effects at the (countdown,
+            election) pairs that have a poll, plus the election days, instead of
+            the full ``election_party_time_effect`` cube of every day of every
+            election. The cost of each gradient then scales with the number of
+            polls, but the cube is not stored in the trace; building the model
+            without this option, as ``forecast_election`` does, computes it.
+        batch_size
+            Only evaluate the poll likelihood on a random minibatch of
+            ``batch_size`` observations, drawn again at each evaluation, and
+            rescale it to the number of observations. The observation-level
+            deterministics (``latent_popularity`` and ``noisy_popularity``)
+            are then left out, as they would only cover the minibatch. Used
+            by ``fit_vi``.
+        deterministics
+            Names of the deterministics recorded in the trace, e.g.
+            ``["latent_pop_t0"]``. Defaults to all of them. The others are not
+            evaluated at each draw, and ``recompute_deterministics`` computes
+            them from the posterior when needed.
+        observations
+            Only evaluate the observation-level terms at these positions of the
+            observations, as a fixed minibatch. Used by
+            ``recompute_deterministics``.
 
         Returns
         -------
         A PyMC model in the form of a pymc.Model() instance.
 
         """
+        from utils.dirichletmultinomial import (
+            SoftmaxDirichletMultinomial,
+            competing_mask,
+            masked_softmax,
+        )
+        from utils.zerosumnormal import ZeroSumNormal
+
+        if batch_size is not None and observations is not None:
+            raise ValueError("Pass either batch_size or observations, not both.")
+        # the tensor and dimensions of every deterministic, recorded or not
+        self.deterministic_values = {}
+
+        def deterministic(name, value, dims, record=True):
+            self.deterministic_values[name] = value, dims
+            if record and (deterministics is None or name in deterministics):
+                return pm.Deterministic(name, value, dims=dims)
+            return value
+
         (
             self.pollster_id,
             self.countdown_id,
@@ -482,6 +1020,27 @@ class PresidentialElectionsModel:
             data_containers, non_competing_parties = self._build_data_containers(
                 polls, continuous_predictors
             )
+            polls_mask = competing_mask(non_competing_parties["polls_multiplicative"])
+            n_obs = len(self.coords["observations"])
+            if batch_size is not None:
+                batch = aet.cast(
+                    aet.floor(
+                        pm.tt_rng().uniform(
+                            size=(batch_size,), low=0, high=n_obs - 1e-10
+                        )
+                    ),
+                    "int64",
+                )
+            elif observations is not None:
+                batch = aet.as_tensor_variable(np.asarray(observations, dtype=np.int64))
+            else:
+                batch = None
+            if batch is not None:
+                (
+                    data_containers,
+                    non_competing_parties,
+                    polls_mask,
+                ) = self._minibatch(data_containers, non_competing_parties, batch)
 
             # --------------------------------------------------------
             #                   BASELINE COMPONENTS
@@ -502,7 +1061,7 @@ class PresidentialElectionsModel:
                 sigma=0.5,
                 dims="parties_complete",
             )
-            election_party_baseline_sd = pm.Deterministic(
+            election_party_baseline_sd = deterministic(
                 "election_party_baseline_sd",
                 aet.exp(lsd_baseline + lsd_party_effect),
                 dims="parties_complete",
@@ -550,7 +1109,7 @@ class PresidentialElectionsModel:
                 dims=("pollsters", "parties_complete", "elections"),
                 zerosum_axes=(0, 1, 2),
             )
-            house_election_effects = pm.Deterministic(
+            house_election_effects = deterministic(
                 "house_election_effects",
                 house_election_effects_sd[..., None] * house_election_effects_raw,
                 dims=("pollsters", "parties_complete", "elections"),
@@ -564,14 +1123,15 @@ class PresidentialElectionsModel:
             # that the opinion "drifts" towards this result during the
             # campaign, so to speak.
             #
-            # The coefficient below accounts for the effect of the
-            # unemployment on the election result.
+            # The coefficients below account for the effect of each
+            # fundamental (unemployment...) on the election result.
             # --------------------------------------------------------
 
-            unemployment_effect = ZeroSumNormal(
-                "unemployment_effect",
+            fundamentals_effect = ZeroSumNormal(
+                "fundamentals_effect",
                 sigma=0.15,
-                dims="parties_complete",
+                dims=("fundamentals", "parties_complete"),
+                zerosum_axes=-1,
             )
 
             # --------------------------------------------------------
@@ -602,7 +1162,7 @@ class PresidentialElectionsModel:
             lsd_party_effect = ZeroSumNormal(
                 "lsd_party_effect_party_amplitude", sigma=0.2, dims="parties_complete"
             )
-            party_time_weight = pm.Deterministic(
+            party_time_weight = deterministic(
                 "party_time_weight",
                 aet.exp(lsd_baseline + lsd_party_effect),
                 dims="parties_complete",
@@ -614,12 +1174,10 @@ class PresidentialElectionsModel:
                 dims=(gp_basis_dim, "parties_complete"),
                 zerosum_axes=-1,
             )
-            party_time_effect = pm.Deterministic(
+            party_time_effect = deterministic(
                 "party_time_effect",
-                aet.tensordot(
-                    gp_basis_funcs,
-                    party_time_weight[None, ...] * party_time_coefs_raw,
-                    axes=(1, 0),
+                apply_gp_basis(
+                    gp_basis_funcs, party_time_weight[None, ...] * party_time_coefs_raw
                 ),
                 dims=("countdown", "parties_complete"),
             )
@@ -640,12 +1198,12 @@ class PresidentialElectionsModel:
                 dims=("parties_complete", "elections"),
                 zerosum_axes=(0, 1),
             )
-            lsd_election_party_effect = pm.Deterministic(
+            lsd_election_party_effect = deterministic(
                 "lsd_election_party_effect",
                 lsd_election_party_sd * lsd_election_party_raw,
                 dims=("parties_complete", "elections"),
             )
-            election_party_time_weight = pm.Deterministic(
+            election_party_time_weight = deterministic(
                 "election_party_time_weight",
                 aet.exp(
                     lsd_party_effect[:, None]
@@ -661,15 +1219,32 @@ class PresidentialElectionsModel:
                 dims=(gp_basis_dim, "parties_complete", "elections"),
                 zerosum_axes=(1, 2),
             )
-            election_party_time_effect = pm.Deterministic(
-                "election_party_time_effect",
-                aet.tensordot(
+            if sparse_time_effects:
+                n_elections = len(self.coords["elections"])
+                election_party_time_effect_obs = apply_gp_basis_at(
                     gp_basis_funcs,
                     election_party_time_coefs,
-                    axes=(1, 0),
-                ),
-                dims=("countdown", "parties_complete", "elections"),
-            )
+                    data_containers["countdown_idx"],
+                    data_containers["election_idx"],
+                    n_batches=n_elections,
+                )
+                election_party_time_effect_t0 = apply_gp_basis_at(
+                    gp_basis_funcs,
+                    election_party_time_coefs,
+                    np.zeros(n_elections, dtype=np.int64),
+                    np.arange(n_elections),
+                    n_batches=n_elections,
+                )
+            else:
+                election_party_time_effect = deterministic(
+                    "election_party_time_effect",
+                    apply_gp_basis(gp_basis_funcs, election_party_time_coefs),
+                    dims=("countdown", "parties_complete", "elections"),
+                )
+                election_party_time_effect_obs = election_party_time_effect[
+                    data_containers["countdown_idx"], :, data_containers["election_idx"]
+                ]
+                election_party_time_effect_t0 = election_party_time_effect[0].T
 
             # --------------------------------------------------------
             #                      POLL RESULTS
@@ -687,18 +1262,17 @@ class PresidentialElectionsModel:
                 party_baseline
                 + election_party_baseline[data_containers["election_idx"]]
                 + party_time_effect[data_containers["countdown_idx"]]
-                + election_party_time_effect[
-                    data_containers["countdown_idx"], :, data_containers["election_idx"]
-                ]
-                + aet.dot(
-                    data_containers["stdz_unemp"][:, None], unemployment_effect[None, :]
-                )
+                + election_party_time_effect_obs
+                + aet.dot(data_containers["stdz_fundamentals"], fundamentals_effect)
             )
             latent_mu = latent_mu + non_competing_parties["polls_additive"]
-            pm.Deterministic(
+            # the shares of the likelihood, without the parties that are not
+            # in the poll
+            deterministic(
                 "latent_popularity",
-                aet.nnet.softmax(latent_mu),
+                masked_softmax(latent_mu, polls_mask),
                 dims=("observations", "parties_complete"),
+                record=batch is None,
             )
             noisy_mu = (
                 latent_mu
@@ -710,10 +1284,11 @@ class PresidentialElectionsModel:
                 * non_competing_parties["polls_multiplicative"]
             )
 
-            noisy_popularity = pm.Deterministic(
+            deterministic(
                 "noisy_popularity",
-                aet.nnet.softmax(noisy_mu),
+                masked_softmax(noisy_mu, polls_mask),
                 dims=("observations", "parties_complete"),
+                record=batch is None,
             )
 
             # The concentration parameter of a Dirichlet-Multinomial distribution
@@ -726,12 +1301,26 @@ class PresidentialElectionsModel:
                 "concentration_polls", mu=1000, sigma=200
             )
 
-            pm.DirichletMultinomial(
+            # the likelihood works on the logits directly, and leaves the
+            # parties that are not in the poll out of the softmax
+            if batch is None:
+                shape = {"dims": ("observations", "parties_complete")}
+            else:
+                shape = {
+                    "shape": (
+                        batch_size or len(observations),
+                        len(self.political_families),
+                    ),
+                    "total_size": n_obs,
+                }
+            SoftmaxDirichletMultinomial(
                 "N_approve",
-                a=concentration_polls * noisy_popularity,
+                logits=noisy_mu,
+                concentration=concentration_polls,
                 n=data_containers["observed_N"],
+                mask=polls_mask,
                 observed=data_containers["observed_polls"],
-                dims=("observations", "parties_complete"),
+                **shape,
             )
 
             # --------------------------------------------------------
@@ -750,17 +1339,15 @@ class PresidentialElectionsModel:
                 party_baseline
                 + election_party_baseline
                 + party_time_effect[0]
-                + election_party_time_effect[0].T
-                + aet.dot(
-                    data_containers["election_unemp"][:, None],
-                    unemployment_effect[None, :],
-                )
+                + election_party_time_effect_t0
+                + aet.dot(data_containers["election_fundamentals"], fundamentals_effect)
             )
             latent_mu_t0 = latent_mu_t0 + non_competing_parties["results"]
+            results_mask = competing_mask(non_competing_parties["results"] == 0)
 
-            latent_pop_t0 = pm.Deterministic(
+            deterministic(
                 "latent_pop_t0",
-                aet.nnet.softmax(latent_mu_t0),
+                masked_softmax(latent_mu_t0, results_mask),
                 dims=("elections", "parties_complete"),
             )
 
@@ -773,14 +1360,23 @@ class PresidentialElectionsModel:
             concentration_results = pm.InverseGamma(
                 "concentration_results", mu=1000, sigma=200
             )
-            pm.DirichletMultinomial(
+            SoftmaxDirichletMultinomial(
                 "R",
-                a=concentration_results * latent_pop_t0[:-1],
+                logits=latent_mu_t0[:-1],
+                concentration=concentration_results,
                 n=data_containers["results_N"],
+                mask=results_mask[:-1],
                 observed=data_containers["observed_results"],
                 dims=("elections_observed", "parties_complete"),
             )
 
+        unknown = set(deterministics or ()) - set(self.deterministic_values)
+        if unknown:
+            raise ValueError(
+                f"Deterministics {sorted(unknown)} are not computed by this "
+                f"model: use some of "
+                f"{list(self.deterministic_values)}."
+            )
         return model
 
     def _build_coords(self, polls: pd.DataFrame = None):
@@ -789,12 +1385,25 @@ class PresidentialElectionsModel:
         COORDS = {
             "observations": data.index,
             "parties_complete": self.political_families,
+            "fundamentals": list(self.fundamentals),
         }
-        pollster_id, COORDS["pollsters"] = data["sondage"].factorize(sort=True)
-        countdown_id, COORDS["countdown"] = data["countdown"].values, np.arange(
-            data["countdown"].max() + 1
+        # the prepared frames are already categorical, with the categories in
+        # the order of the coordinates
+        pollsters = data["sondage"].astype("category").cat.remove_unused_categories()
+        pollster_id, COORDS["pollsters"] = (
+            pollsters.cat.codes.to_numpy(dtype=np.int64),
+            pollsters.cat.categories,
+        )
+        countdown_id, COORDS["countdown"] = data["countdown"].to_numpy(
+            dtype=np.int64
+        ), np.arange(int(data["countdown"].max()) + 1)
+        elections = (
+            data["dateelection"].astype("category").cat.remove_unused_categories()
+        )
+        election_id, COORDS["elections"] = (
+            elections.cat.codes.to_numpy(dtype=np.int64),
+            elections.cat.categories,
         )
-        election_id, COORDS["elections"] = data["dateelection"].factorize()
         COORDS["elections_observed"] = COORDS["elections"][:-1]
 
         return pollster_id, countdown_id, election_id, COORDS
@@ -830,15 +1439,15 @@ class PresidentialElectionsModel:
             countdown_idx=pm.Data(
                 "countdown_idx", self.countdown_id, dims="observations"
             ),
-            stdz_unemp=pm.Data(
-                "stdz_unemp",
-                campaign_predictors["unemployment"].to_numpy(),
-                dims="observations",
+            stdz_fundamentals=pm.Data(
+                "stdz_fundamentals",
+                campaign_predictors[self.coords["fundamentals"]].to_numpy(),
+                dims=("observations", "fundamentals"),
             ),
-            election_unemp=pm.Data(
-                "election_unemp",
-                self.results_preds["unemployment"].to_numpy(),
-                dims="elections",
+            election_fundamentals=pm.Data(
+                "election_fundamentals",
+                self.results_preds[self.coords["fundamentals"]].to_numpy(),
+                dims=("elections", "fundamentals"),
             ),
             observed_N=pm.Data(
                 "observed_N",
@@ -864,14 +1473,54 @@ class PresidentialElectionsModel:
 
         return data_containers, non_competing_parties
 
+    # data containers and masks with one row per observation
+    _observation_data = [
+        "election_idx",
+        "pollster_idx",
+        "countdown_idx",
+        "stdz_fundamentals",
+        "observed_N",
+        "observed_polls",
+    ]
+    _observation_masks = ["polls_additive", "polls_multiplicative"]
+
+    def _minibatch(
+        self,
+        data_containers: Dict[str, pm.Data],
+        non_competing_parties: Dict[str, np.ndarray],
+        batch: aet.TensorVariable,
+    ) -> Tuple[Dict, Dict, aet.TensorVariable]:
+        """
+        Gather the observation-level data at the positions ``batch``, e.g. a
+        random minibatch drawn with replacement each time the graph is
+        evaluated, as ``pm.Minibatch`` does. Returns the data containers, the
+        masks and the mask of the likelihood for the minibatch.
+        """
+        from utils.dirichletmultinomial import competing_mask
+
+        polls_mask = aet.as_tensor_variable(
+            competing_mask(non_competing_parties["polls_multiplicative"])
+        )[batch]
+        data_containers = data_containers | {
+            name: data_containers[name][batch] for name in self._observation_data
+        }
+        non_competing_parties = non_competing_parties | {
+            name: aet.as_tensor_variable(non_competing_parties[name])[batch]
+            for name in self._observation_masks
+        }
+        return data_containers, non_competing_parties, polls_mask
+
     def sample_all(
-        self, *, model: pm.Model = None, var_names: List[str], **sampler_kwargs
+        self,
+        *,
+        model: pm.Model = None,
+        var_names: List[str],
+        ppc_processes: int = None,
+        **sampler_kwargs,
     ) -> arviz.InferenceData:
         """
-        Sample the model and return the trace.
-
-        TODO: Add 3 distinct functions to sample from the prior predictive,
-        posterior and posterior predictive distributions.
+        Sample the posterior, the prior predictive and the posterior predictive
+        of the model, and return them in one trace.
 
         Parameters
         ----------
@@ -879,28 +1528,376 @@ class PresidentialElectionsModel:
             A model previously created using `self.build_model()`.
             Build a new model if None (default)
         var_names: List[str]
-            Variables names passed to `pm.fast_sample_posterior_predictive`
+            Variables names drawn from the posterior predictive by
+            `utils.posteriorpredictive.sample_posterior_predictive`
+        ppc_processes: optional
+            Number of processes drawing the posterior predictive. Defaults to
+            drawing it in this process.
         **sampler_kwargs : dict
-            Additional arguments to `pm.sample`
+            Additional arguments to `sample_posterior`, e.g. ``backend``,
+            ``warm_start`` or ``trace_store``, and to the sampler.
         """
         if model is None:
             model = self.build_model()
+        idata = self.sample_posterior(model=model, **sampler_kwargs)
+        idata.extend(self.sample_prior_predictive(model=model))
+        idata.extend(
+            self.sample_posterior_predictive(
+                idata,
+                var_names=var_names,
+                model=model,
+                random_seed=sampler_kwargs.get("random_seed"),
+                processes=ppc_processes,
+            )
+        )
+        return idata
 
+    def sample_prior_predictive(
+        self, *, model: pm.Model = None, samples: int = 500, random_seed: int = None
+    ) -> arviz.InferenceData:
+        """
+        Sample the prior and prior predictive of the model, and return them
+        with the observed and constant data.
+        """
+        if model is None:
+            model = self.build_model()
         with model:
-            prior_checks = pm.sample_prior_predictive()
-            trace = pm.sample(return_inferencedata=False, **sampler_kwargs)
-            post_checks = pm.fast_sample_posterior_predictive(
-                trace, var_names=var_names
+            prior_checks = pm.sample_prior_predictive(
+                samples=samples, random_seed=random_seed
+            )
+        return arviz.from_pymc3(prior=prior_checks, model=model)
+
+    def sample_posterior(
+        self,
+        *,
+        model: pm.Model = None,
+        backend: str = "pymc3",
+        warm_start: Union[arviz.InferenceData, str] = None,
+        trace_store: str = None,
+        **sampler_kwargs,
+    ) -> arviz.InferenceData:
+        """
+        Sample the posterior of the model and return the trace.
+
+        Parameters
+        ----------
+        model : optional
+            A model previously created using `self.build_model()`.
+            Build a new model if None (default)
+        backend: str
+            ``"pymc3"`` to sample with `pm.sample`, ``"jax"`` to translate the
+            model to JAX and sample all the chains at once, vectorized in this
+            process, with `utils.jaxsampling.sample_numpyro_nuts`. The trace
+            has the same layout.
+        warm_start: optional
+            The trace of a previous run on (almost) the same data, its
+            `utils.warmstart.adaptation_state`, or the path of a saved one.
+            NUTS then starts from its step size, mass matrix (dense with
+            ``init="adapt_full"``) and last draws, mapped onto the coordinates
+            of the model, and ``tune`` defaults to 200. Only with the
+            ``"pymc3"`` backend.
+        trace_store: optional
+            Directory of a zarr store the draws are written to as they are
+            produced, by chunks, with `utils.zarrtrace.ZarrTrace`, instead of
+            being kept in memory. The posterior and sampler statistics of the
+            returned trace are then read lazily from the store, as dask
+            arrays, and convergence checks are off unless
+            ``compute_convergence_checks`` is set, as they would load the whole
+            trace. Only with the ``"pymc3"`` backend.
+        **sampler_kwargs : dict
+            Additional arguments to `pm.sample`, or to `sample_numpyro_nuts`
+
+        Returns
+        -------
+        The posterior and sampler statistics, and with the ``"pymc3"`` backend
+        and no ``trace_store``, the observed and constant data.
+        """
+        if backend not in ("pymc3", "jax"):
+            raise ValueError(f"Unknown backend {backend!r}: use 'pymc3' or 'jax'.")
+        if warm_start is not None and backend != "pymc3":
+            raise ValueError("Warm starts are only supported by the 'pymc3' backend.")
+        if trace_store is not None and backend != "pymc3":
+            raise ValueError("Trace stores are only supported by the 'pymc3' backend.")
+        if model is None:
+            model = self.build_model()
+        if trace_store is not None:
+            sampler_kwargs.setdefault("compute_convergence_checks", False)
+            # the default number of chains of ``pm.sample``
+            cores = sampler_kwargs.get("cores") or min(4, os.cpu_count())
+            sampler_kwargs["trace"] = zarrtrace.zarr_traces(
+                trace_store,
+                chains=sampler_kwargs.setdefault("chains", max(2, cores)),
+                chain_idx=sampler_kwargs.get("chain_idx", 0),
+                model=model,
             )
 
-        return arviz.from_pymc3(
-            trace=trace,
-            prior=prior_checks,
+        with model:
+            if warm_start is not None:
+                state = warmstart.load_adaptation_state(warm_start)
+                chains = sampler_kwargs.setdefault(
+                    "chains", state.posterior.dims["chain"]
+                )
+                sampler_kwargs.setdefault("tune", 200)
+                sampler_kwargs["step"], sampler_kwargs["start"] = warmstart.warm_start(
+                    model,
+                    state,
+                    chains=chains,
+                    dense_mass=sampler_kwargs.pop("init", "auto").endswith(
+                        "adapt_full"
+                    ),
+                    target_accept=sampler_kwargs.pop("target_accept", 0.8),
+                )
+            if backend == "jax":
+                return jaxsampling.sample_numpyro_nuts(model, **sampler_kwargs)
+            trace = pm.sample(return_inferencedata=False, **sampler_kwargs)
+        if trace_store is not None:
+            # the tuning draws are in the store too, unless they are discarded
+            tune = 0
+            if sampler_kwargs.get("discard_tuned_samples", True):
+                tune = sampler_kwargs.get("tune", 1000)
+            return zarrtrace.open_trace(trace_store, tune=tune)
+        return arviz.from_pymc3(trace=trace, model=model)
+
+    def sample_posterior_predictive(
+        self,
+        idata: arviz.InferenceData,
+        *,
+        var_names: List[str],
+        model: pm.Model = None,
+        random_seed: int = None,
+        processes: int = None,
+    ) -> arviz.InferenceData:
+        """
+        Sample the posterior predictive of the model at the draws of the
+        posterior of ``idata``, with
+        `utils.posteriorpredictive.sample_posterior_predictive`, and return it.
+        """
+        if model is None:
+            model = self.build_model()
+        with model:
+            post_checks = posteriorpredictive.sample_posterior_predictive(
+                model,
+                idata.posterior,
+                var_names,
+                random_seed=random_seed,
+                processes=processes,
+            )
+        return arviz.from_dict(
             posterior_predictive=post_checks,
-            model=model,
+            coords=model.coords,
+            dims=model.RV_dims,
+        )
+
+    @staticmethod
+    def _free_variable_names(model: pm.Model) -> List[str]:
+        """Names of the free variables of ``model`` in a trace, i.e. untransformed."""
+        return [
+            pm.util.get_untransformed_name(var.name)
+            if pm.util.is_transformed_name(var.name)
+            else var.name
+            for var in model.free_RVs
+        ]
+
+    def recompute_deterministics(
+        self,
+        idata: arviz.InferenceData,
+        var_names: List[str],
+        coords: Dict[str, List] = None,
+        chunk_draws: int = 100,
+    ) -> xr.Dataset:
+        """
+        Compute deterministics of the model from the posterior draws of its
+        free variables, e.g. the ones left out of the trace with
+        ``build_model(deterministics=...)``.
+
+        The graph of the deterministics is restricted to the coordinates
+        requested before it is compiled, so that only these values are
+        computed: the observation-level terms are only evaluated at the
+        observations requested, and the other dimensions are indexed. It is
+        then evaluated on chunks of ``chunk_draws`` draws at a time, with
+        `utils.deterministics.evaluate_draws`.
+
+        Parameters
+        ----------
+        idata
+            Trace of the model built on the training data.
+        var_names
+            Names of the deterministics, as in ``build_model``.
+        coords: optional
+            Labels to compute the deterministics at, by dimension, e.g.
+            ``{"parties_complete": ["LR", "LREM"], "countdown": [0]}``.
+            Defaults to all the coordinates of the model.
+        chunk_draws
+            Number of draws computed at once.
+
+        Returns
+        -------
+        The deterministics, with ``chain`` and ``draw`` dimensions.
+        """
+        from utils.deterministics import draws_function, evaluate_draws
+
+        coords = dict(coords or {})
+        observations = None
+        if "observations" in coords:
+            observations = self._positions(
+                self.polls_train.index, coords.pop("observations")
+            )
+        model = self.build_model(observations=observations)
+
+        outputs, dims, out_coords = [], {}, {}
+        for name in var_names:
+            if name not in self.deterministic_values:
+                raise ValueError(
+                    f"{name} is not a deterministic of the model: use one of "
+                    f"{list(self.deterministic_values)}."
+                )
+            value, var_dims = self.deterministic_values[name]
+            dims[name] = [var_dims] if isinstance(var_dims, str) else list(var_dims)
+            for axis, dim in enumerate(dims[name]):
+                labels = pd.Index(model.coords[dim])
+                if dim == "observations":
+                    # already evaluated at these observations only
+                    if observations is not None:
+                        labels = labels[observations]
+                elif dim in coords:
+                    positions = self._positions(labels, coords[dim])
+                    value = aet.take(value, positions, axis=axis)
+                    labels = labels[positions]
+                out_coords[dim] = labels
+            outputs.append(value)
+
+        free_names = self._free_variable_names(model)
+        with model:
+            fn = draws_function([model[name] for name in free_names], outputs)
+        values = evaluate_draws(fn, idata.posterior, free_names, chunk_draws)
+
+        return xr.Dataset(
+            {
+                name: (["chain", "draw"] + dims[name], value)
+                for name, value in zip(var_names, values)
+            },
+            coords={
+                "chain": idata.posterior["chain"].to_numpy(),
+                "draw": idata.posterior["draw"].to_numpy(),
+                **out_coords,
+            },
+        )
+
+    @staticmethod
+    def _positions(index: pd.Index, labels: List) -> np.ndarray:
+        """Positions of ``labels`` in ``index``, with all the repeats of a label."""
+        positions = pd.Index(index).get_indexer_for(labels)
+        if (positions < 0).any():
+            missing = [label for label in labels if label not in index]
+            raise KeyError(f"{missing} not in the coordinates.")
+        return positions
+
+    def fit_vi(
+        self,
+        *,
+        var_names: List[str],
+        method: str = "advi",
+        batch_size: int = None,
+        n: int = 30_000,
+        draws: int = 1000,
+        callbacks: List = None,
+        random_seed: int = None,
+        **fit_kwargs,
+    ) -> arviz.InferenceData:
+        """
+        Fit a variational approximation of the posterior and return draws from
+        it, in an ``InferenceData`` with the same groups as ``sample_all``.
+
+        Parameters
+        ----------
+        var_names: List[str]
+            Variables names drawn from the posterior predictive by
+            `utils.posteriorpredictive.sample_posterior_predictive`
+        method: str
+            ``"advi"`` for a mean-field approximation, ``"fullrank_advi"`` for
+            a multivariate normal one.
+        batch_size: int, optional
+            Number of observations in the minibatches the poll likelihood is
+            evaluated on, at each step of the optimization. Defaults to all of
+            them.
+        n: int
+            Number of optimization steps.
+        draws: int
+            Number of draws from the approximation.
+        callbacks: List, optional
+            Called with the approximation, the losses and the step number after
+            each step, and can stop the optimization by raising
+            ``StopIteration``. Defaults to checking the convergence of the
+            parameters of the approximation.
+        random_seed: int, optional
+            Seed of the minibatches and of the approximation.
+        **fit_kwargs : dict
+            Additional arguments to `pm.fit`
+        """
+        if method not in ("advi", "fullrank_advi"):
+            raise ValueError(
+                f"Unknown variational method {method!r}: "
+                "use 'advi' or 'fullrank_advi'."
+            )
+        if callbacks is None:
+            callbacks = [pm.callbacks.CheckParametersConvergence(diff="absolute")]
+        if random_seed is not None:
+            pm.set_tt_rng(random_seed)
+
+        model = self.build_model()
+        vi_model = (
+            model if batch_size is None else self.build_model(batch_size=batch_size)
+        )
+
+        with model:
+            prior_checks = pm.sample_prior_predictive(random_seed=random_seed)
+        with vi_model:
+            approx = pm.fit(
+                n=n,
+                method=method,
+                callbacks=callbacks,
+                random_seed=random_seed,
+                **fit_kwargs,
+            )
+            trace = approx.sample(draws, return_inferencedata=False)
+
+        # the deterministics that the minibatch model leaves out are computed
+        # from the draws on the full dataset
+        missing = [
+            var.name for var in model.deterministics if var.name not in trace.varnames
+        ]
+        idata = arviz.from_pymc3(trace=trace, prior=prior_checks, model=model)
+        with model:
+            post_checks = posteriorpredictive.sample_posterior_predictive(
+                model,
+                idata.posterior,
+                var_names + missing,
+                random_seed=random_seed,
+            )
+
+        idata.extend(
+            arviz.from_dict(
+                posterior_predictive={name: post_checks[name] for name in var_names},
+                coords=model.coords,
+                dims=model.RV_dims,
+            )
         )
+        for name in missing:
+            dims = model.RV_dims[name]
+            idata.posterior[name] = xr.DataArray(
+                post_checks[name],
+                dims=("chain", "draw") + tuple(dims),
+                coords={dim: model.coords[dim] for dim in dims},
+            )
+
+        return idata
 
-    def forecast_election(self, idata: arviz.InferenceData) -> arviz.InferenceData:
+    def forecast_election(
+        self,
+        idata: arviz.InferenceData,
+        random_seed: int = None,
+        processes: int = None,
+    ) -> arviz.InferenceData:
         """
         Generate out-of-sample predictions for ``election_to_predict`` specified in ``__init__``.
 
@@ -911,8 +1908,18 @@ class PresidentialElectionsModel:
             The dataset used for predictions is generated automatically: one observation for each
             of the days in ``self.coords["countdown"]``. The corresponding values of predictors are
             handled automatically.
+        random_seed: int, optional
+            Seed of the predictions.
+        processes: int, optional
+            Number of processes drawing the predictions. Defaults to drawing
+            them in this process.
+
+        Returns
+        -------
+        ``idata`` with the ``predictions`` and ``predictions_constant_data``
+        groups.
         """
-        new_dates, oos_data = self._generate_oos_data(idata)
+        new_dates, oos_data = self._generate_oos_data(idata, random_seed)
         oos_data = self._join_with_continuous_predictors(oos_data)
         forecast_data_index = pd.DataFrame(
             data=0,  # just a placeholder
@@ -933,8 +1940,9 @@ class PresidentialElectionsModel:
             continuous_predictors=forecast_data,
         )
         with forecast_model:
-            ppc = pm.fast_sample_posterior_predictive(
-                idata,
+            predictions = posteriorpredictive.sample_posterior_predictive(
+                forecast_model,
+                idata.posterior,
                 var_names=[
                     "party_baseline",
                     "latent_popularity",
@@ -943,21 +1951,26 @@ class PresidentialElectionsModel:
                     "latent_pop_t0",
                     "R",
                 ],
+                random_seed=random_seed,
+                processes=processes,
             )
-            ppc = arviz.from_pymc3_predictions(
-                ppc,
-                idata_orig=idata,
-                inplace=False,
-                coords=PREDICTION_COORDS,
-                dims=PREDICTION_DIMS,
-            )
+        ppc = arviz.from_dict(
+            predictions=predictions,
+            predictions_constant_data={
+                name: var.get_value()
+                for name, var in forecast_model.named_vars.items()
+                if hasattr(var, "get_value")  # the data containers
+            },
+            coords=forecast_model.coords | PREDICTION_COORDS,
+            dims=forecast_model.RV_dims | PREDICTION_DIMS,
+        )
 
-        return ppc
+        return arviz.concat(idata, ppc, dim=None, copy=True)
 
     def _generate_oos_data(
-        self, idata: arviz.InferenceData
+        self, idata: arviz.InferenceData, random_seed: int = None
     ) -> Tuple[pd.Index, pd.DataFrame]:
-
+        rng = np.random.default_rng(random_seed)
         countdown = idata.posterior["countdown"]
         elections = idata.posterior["elections"]
 
@@ -980,10 +1993,8 @@ class PresidentialElectionsModel:
                 "dateelection": np.repeat(
                     self.unique_elections, repeats=len(countdown)
                 ),
-                "sondage": np.random.choice(
-                    self.unique_pollsters, size=N_estimated_days
-                ),
-                "samplesize": np.random.choice(
+                "sondage": rng.choice(self.unique_pollsters, size=N_estimated_days),
+                "samplesize": rng.choice(
                     self.results_oos["samplesize"].values, size=N_estimated_days
                 ),
             }
@@ -993,16 +2004,14 @@ class PresidentialElectionsModel:
         return new_dates, oos_data.set_index("date")
 
     def _join_with_continuous_predictors(self, oos_data: pd.DataFrame) -> pd.DataFrame:
-        oos_data["quarter"] = oos_data.index.to_period("Q")
-        oos_data["month"] = oos_data.index.to_period("M")
-
-        oos_data = oos_data.join(self.unemployment_data, on="quarter")
+        names = list(self.fundamentals)
+        oos_data[names] = self._align_fundamentals(oos_data.index)
         # check no missing values
         np.testing.assert_allclose(0, oos_data.isna().any().mean())
 
         # stdz predictors based on observed values
-        oos_data["unemployment"] = (
-            oos_data["unemployment"] - self.continuous_predictors["unemployment"].mean()
-        ) / self.continuous_predictors["unemployment"].std()
+        oos_data[names] = (
+            oos_data[names] - self.continuous_predictors[names].mean()
+        ) / self.continuous_predictors[names].std()
 
         return oos_data.reset_index()
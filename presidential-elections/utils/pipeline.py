@@ -0,0 +1,365 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from utils._lazy import LazyModule
+
+arviz = LazyModule("arviz")
+pd = LazyModule("pandas")
+
+"""
+Staged forecast pipeline, from the data sources to the figures.
+
+    python -m utils.pipeline --election-date 2022-04-10 --store runs --jobs 2
+
+The forecast runs as a chain of stages, each reading the outputs of the stages
+it depends on and writing its own to ``<store>/<stage>/<key>/``:
+
+- ``data``: the prepared data, as a snapshot (see ``utils.snapshot``);
+- ``basis``: the GP basis of the campaign, as a ``BasisCache`` directory;
+- ``prior``: the prior and prior predictive;
+- ``posterior``: the trace;
+- ``ppc``: the posterior predictive;
+- ``forecast``: the predictions of ``forecast_election``;
+- ``figures``: the predictive checks and the forecast, as PNG files.
+
+The key of a stage hashes its configuration and the keys of the stages it
+depends on, and the key of ``data`` is the snapshot key of the raw inputs, so
+a stage only runs again when something it depends on changed: new polls
+invalidate everything, whereas more draws leave ``data``, ``basis`` and
+``prior`` cached. The
+stages whose inputs are ready run in parallel in a pool of ``--jobs``
+processes, e.g. ``prior`` with ``posterior``, and ``ppc`` with ``forecast``.
+Each output is written next to its final location and moved there in one
+step, so an interrupted stage leaves nothing behind.
+"""
+
+_log = logging.getLogger(__name__)
+
+# Bump when what a stage writes changes for the same key.
+PIPELINE_VERSION = 1
+
+
+def _model(config: Dict, inputs: Dict[str, Path]):
+    """The model builder on the prepared data, with the GP bases of ``basis``."""
+    from utils.gpapproximation import basis_cache
+    from utils.model import PresidentialElectionsModel
+
+    if "basis" in inputs:
+        basis_cache.cache_dir = inputs["basis"]
+    return PresidentialElectionsModel.from_snapshot(
+        inputs["data"] / "snapshot",
+        timescales=config["timescales"],
+        weights=config["weights"],
+    )
+
+
+def _run_data(config: Dict, inputs: Dict[str, Path], output: Path):
+    from utils.model import PresidentialElectionsModel
+
+    PresidentialElectionsModel(
+        election_date=config["election_date"], test_cutoff=_test_cutoff(config)
+    ).save_snapshot(output / "snapshot")
+
+
+def _run_basis(config: Dict, inputs: Dict[str, Path], output: Path):
+    from utils.gpapproximation import BasisCache
+
+    model = _model(config, inputs)
+    countdown = model._build_coords()[3]["countdown"]
+    BasisCache(cache_dir=output).get(countdown, model.gp_config)
+
+
+def _run_prior(config: Dict, inputs: Dict[str, Path], output: Path):
+    model = _model(config, inputs)
+    model.sample_prior_predictive(
+        samples=config["prior_samples"], random_seed=config["seed"]
+    ).to_netcdf(str(output / "idata.nc"))
+
+
+def _run_posterior(config: Dict, inputs: Dict[str, Path], output: Path):
+    model = _model(config, inputs)
+    model.sample_posterior(
+        backend=config["backend"],
+        draws=config["draws"],
+        tune=config["tune"],
+        chains=config["chains"],
+        random_seed=config["seed"],
+    ).to_netcdf(str(output / "idata.nc"))
+
+
+def _run_ppc(config: Dict, inputs: Dict[str, Path], output: Path):
+    model = _model(config, inputs)
+    model.sample_posterior_predictive(
+        arviz.from_netcdf(str(inputs["posterior"] / "idata.nc")),
+        var_names=config["var_names"],
+        random_seed=config["seed"],
+        processes=config["processes"],
+    ).to_netcdf(str(output / "idata.nc"))
+
+
+def _run_forecast(config: Dict, inputs: Dict[str, Path], output: Path):
+    model = _model(config, inputs)
+    forecast = model.forecast_election(
+        arviz.from_netcdf(str(inputs["posterior"] / "idata.nc")),
+        random_seed=config["seed"],
+        processes=config["processes"],
+    )
+    arviz.InferenceData(
+        predictions=forecast.predictions,
+        predictions_constant_data=forecast.predictions_constant_data,
+    ).to_netcdf(str(output / "idata.nc"))
+
+
+def _run_figures(config: Dict, inputs: Dict[str, Path], output: Path):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from utils import posteriorplots
+
+    model = _model(config, inputs)
+    prior = arviz.from_netcdf(str(inputs["prior"] / "idata.nc"))
+    posterior = arviz.from_netcdf(str(inputs["posterior"] / "idata.nc"))
+    posterior.extend(arviz.from_netcdf(str(inputs["ppc"] / "idata.nc")))
+    # the observed and constant data, when the trace doesn't have them
+    posterior.extend(prior)
+    forecast = arviz.from_netcdf(str(inputs["forecast"] / "idata.nc"))
+
+    figures = {
+        "prior_predictive": lambda: posteriorplots.retrodictive_plot(
+            prior, model.political_families, model.polls_train, group="prior"
+        ),
+        "posterior_predictive": lambda: posteriorplots.retrodictive_plot(
+            posterior, model.political_families, model.polls_train
+        ),
+        "forecast": lambda: posteriorplots.predictive_plot(
+            forecast,
+            model.political_families,
+            model.election_date,
+            model.polls_train,
+            model.polls_test,
+        ),
+    }
+    for name, plot in figures.items():
+        plot()
+        plt.gcf().savefig(output / f"{name}.png", bbox_inches="tight")
+        plt.close("all")
+
+
+# The stages in the order they run, with the stages they read and the settings
+# their output depends on. The draws of ``ppc`` and ``forecast`` don't depend on
+# the number of ``processes`` drawing them.
+STAGES = {
+    "data": {"run": _run_data, "deps": [], "params": []},
+    "basis": {
+        "run": _run_basis,
+        "deps": ["data"],
+        "params": ["timescales", "weights"],
+    },
+    "prior": {
+        "run": _run_prior,
+        "deps": ["data", "basis"],
+        "params": ["timescales", "weights", "prior_samples", "seed"],
+    },
+    "posterior": {
+        "run": _run_posterior,
+        "deps": ["data", "basis"],
+        "params": [
+            "timescales",
+            "weights",
+            "backend",
+            "draws",
+            "tune",
+            "chains",
+            "seed",
+        ],
+    },
+    "ppc": {
+        "run": _run_ppc,
+        "deps": ["data", "basis", "posterior"],
+        "params": ["var_names", "seed"],
+    },
+    "forecast": {
+        "run": _run_forecast,
+        "deps": ["data", "basis", "posterior"],
+        "params": ["seed"],
+    },
+    "figures": {
+        "run": _run_figures,
+        "deps": ["data", "prior", "posterior", "ppc", "forecast"],
+        "params": [],
+    },
+}
+
+
+def _test_cutoff(config: Dict):
+    if not config["test_days"]:
+        return None
+    return pd.Timedelta(config["test_days"], "D")
+
+
+def _hash(**params) -> str:
+    params = {"version": PIPELINE_VERSION} | params
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()[:20]
+
+
+def stage_keys(config: Dict) -> Dict[str, str]:
+    """Key of the output of each stage."""
+    from utils.model import PresidentialElectionsModel
+
+    data = PresidentialElectionsModel(
+        election_date=config["election_date"], test_cutoff=_test_cutoff(config)
+    )
+    keys = {"data": _hash(stage="data", snapshot=data.snapshot_key())}
+    for name, stage in STAGES.items():
+        if name == "data":
+            continue
+        keys[name] = _hash(
+            stage=name,
+            params={param: config[param] for param in stage["params"]},
+            deps={dep: keys[dep] for dep in stage["deps"]},
+        )
+    return keys
+
+
+def _with_upstream(stages: Iterable[str]) -> List[str]:
+    """``stages`` and all the stages they depend on, in the order they run."""
+    needed = set()
+    pending = list(stages)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending += STAGES[name]["deps"]
+    return [name for name in STAGES if name in needed]
+
+
+def _run_stage(name: str, config: Dict, inputs: Dict[str, Path], output: Path):
+    """Run the stage ``name`` and move its output to ``output`` once complete."""
+    tmp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    STAGES[name]["run"](config, inputs, tmp)
+    try:
+        os.replace(tmp, output)
+    except OSError:
+        # another run already wrote the same output
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def run(
+    config: Dict, stages: List[str] = None, store: str = "runs", jobs: int = 1
+) -> Dict[str, Path]:
+    """
+    Run ``stages`` (all of them by default) and the stages they depend on,
+    except those whose output for the current key is already in ``store``,
+    with at most ``jobs`` stages at a time.
+
+    Returns
+    -------
+    The directory of the output of each stage.
+    """
+    keys = stage_keys(config)
+    needed = _with_upstream(stages or STAGES)
+    paths = {name: Path(store) / name / keys[name] for name in needed}
+    done = {name for name in needed if paths[name].exists()}
+    todo = [name for name in needed if name not in done]
+    for name in needed:
+        _log.info("%s %s: %s", name, keys[name], "cached" if name in done else "to run")
+
+    with ProcessPoolExecutor(jobs) as executor:
+        running = {}
+        while todo or running:
+            for name in [
+                name
+                for name in todo
+                if all(dep in done for dep in STAGES[name]["deps"])
+            ]:
+                todo.remove(name)
+                inputs = {dep: paths[dep] for dep in STAGES[name]["deps"]}
+                future = executor.submit(_run_stage, name, config, inputs, paths[name])
+                running[future] = name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                done.add(name)
+                _log.info("%s %s: done", name, keys[name])
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the stages of the forecast that are not cached yet."
+    )
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        metavar="stage",
+        help=f"Stages to run, with the ones they depend on, among {list(STAGES)}. "
+        "Defaults to all.",
+    )
+    parser.add_argument("--election-date", required=True)
+    parser.add_argument(
+        "--test-days",
+        type=int,
+        default=0,
+        help="Days of polls before the election left out of the training data.",
+    )
+    parser.add_argument("--timescales", type=int, nargs="+", default=[5, 14, 28])
+    parser.add_argument("--weights", type=float, nargs="+")
+    parser.add_argument("--prior-samples", type=int, default=500)
+    parser.add_argument("--backend", choices=["pymc3", "jax"], default="pymc3")
+    parser.add_argument("--draws", type=int, default=1000)
+    parser.add_argument("--tune", type=int, default=1000)
+    parser.add_argument("--chains", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=2022)
+    parser.add_argument(
+        "--var-names", nargs="+", default=["N_approve", "R", "latent_popularity"]
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Processes drawing the posterior predictive and the predictions.",
+    )
+    parser.add_argument("--store", default="runs", help="Directory of the outputs.")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Stages run at the same time."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the key of each stage and whether it is cached.",
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages {unknown}: use some of {list(STAGES)}")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    config = vars(args)
+    stages = config.pop("stages")
+    store, jobs = config.pop("store"), config.pop("jobs")
+    if config.pop("dry_run"):
+        keys = stage_keys(config)
+        for name in _with_upstream(stages or STAGES):
+            cached = (Path(store) / name / keys[name]).exists()
+            print(f"{name:<10} {keys[name]} {'cached' if cached else 'to run'}")
+        return
+
+    for name, path in run(config, stages, store=store, jobs=jobs).items():
+        print(f"{name:<10} {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,28 @@
+from __future__ import annotations
+
+from functools import lru_cache
 from typing import List
 
-import arviz
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-import seaborn as sns
 from scipy.special import softmax
+from utils._lazy import LazyModule
+
+arviz = LazyModule("arviz")
+pd = LazyModule("pandas")
+plt = LazyModule("matplotlib.pyplot")
+sns = LazyModule("seaborn")
+
+
+@lru_cache(maxsize=None)
+def _palette() -> List:
+    return sns.color_palette(as_cmap=True)
+
 
-colors = sns.color_palette(as_cmap=True)
+def __getattr__(name):
+    # the palette is only built when plotting
+    if name == "colors":
+        return _palette()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def retrodictive_plot(
@@ -16,6 +31,7 @@ def retrodictive_plot(
     polls_train: pd.DataFrame,
     group: str = "posterior",
 ):
+    colors = _palette()
     if len(parties_complete) % 2 == 0:
         fig, axes = plt.subplots(
             len(parties_complete) // 2, 2, figsize=(12, 15), sharey=True
@@ -98,6 +114,7 @@ def predictive_plot(
     # test_cutoff: pd.Timedelta = None,
     hdi: bool = False,
 ):
+    colors = _palette()
     election_date = pd.to_datetime(election_date)
     # results = results[results.dateelection == election_date]
     new_dates = idata.predictions_constant_data["observations"].to_index()
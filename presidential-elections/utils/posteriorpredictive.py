@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+from utils._lazy import LazyModule
+
+pm = LazyModule("pymc3")
+xr = LazyModule("xarray")
+
+"""
+Posterior predictive draws of the model, in batched numpy.
+
+``pm.fast_sample_posterior_predictive`` evaluates the model and draws its
+random variables one posterior draw at a time, from Python. Here the
+parameters of the Dirichlet-Multinomial likelihoods (their logits and
+concentration) and the other variables requested are computed for a chunk of
+draws by ``utils.deterministics.draws_function``, and the counts of all the
+draws and rows of the chunk are drawn together, in batched numpy: gamma draws,
+normalized into shares, then multinomial draws as chains of binomial draws.
+The draws of each chunk are independent of the others, with their own seed spawned from
+``random_seed``, so they can be drawn in a pool of processes and are the same
+whatever the number of processes.
+"""
+
+
+def _dirichlet_multinomial_chunk(
+    seed: np.random.SeedSequence,
+    logits: np.ndarray,
+    concentration: np.ndarray,
+    n: np.ndarray,
+    mask: np.ndarray,
+) -> np.ndarray:
+    """
+    Counts drawn at each draw of a chunk, from the ``(draw, row, category)``
+    logits and the concentrations, one per draw or per draw and row.
+    """
+    from utils.dirichletmultinomial import (
+        dirichlet_multinomial_rvs,
+        masked_log_softmax,
+    )
+
+    shares = np.exp(masked_log_softmax(logits, mask))
+    # one concentration per draw, or per draw and row
+    concentration = concentration.reshape(
+        concentration.shape + (1,) * (3 - concentration.ndim)
+    )
+    return dirichlet_multinomial_rvs(
+        np.random.default_rng(seed), n, concentration * shares
+    )
+
+
+def sample_posterior_predictive(
+    model: pm.Model,
+    posterior: xr.Dataset,
+    var_names: List[str],
+    random_seed: int = None,
+    chunk_draws: int = 100,
+    processes: int = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Draws of the observed variables ``var_names`` of ``model`` at each draw of
+    ``posterior``, as ``pm.fast_sample_posterior_predictive``.
+
+    Parameters
+    ----------
+    model
+        The model, whose free variables are in ``posterior``. It can be built
+        on other data, e.g. for out-of-sample predictions.
+    posterior
+        The posterior group of a trace.
+    var_names
+        The observed variables to draw, which must be
+        ``SoftmaxDirichletMultinomial``, and other variables of the model,
+        which are computed from the draws of the free variables.
+    random_seed
+        Seed of the draws.
+    chunk_draws
+        Number of draws of a chain computed at once.
+    processes
+        Number of processes drawing the counts of the chunks. Defaults to
+        drawing them in this process.
+
+    Returns
+    -------
+    The values of ``var_names``, as ``(chain, draw, ...)`` arrays.
+    """
+    from utils.deterministics import draws_function, iter_draws
+    from utils.dirichletmultinomial import SoftmaxDirichletMultinomial
+
+    observed = {var.name: var for var in model.observed_RVs}
+    # for each variable, the positions of its outputs, and for the
+    # likelihoods, their totals and masks, which only depend on the data
+    outputs, positions, data = [], {}, {}
+    for name in var_names:
+        positions[name] = len(outputs)
+        if name not in observed:
+            outputs.append(model[name])
+            continue
+        distribution = observed[name].distribution
+        if not isinstance(distribution, SoftmaxDirichletMultinomial):
+            raise ValueError(
+                f"{name} is not a SoftmaxDirichletMultinomial and can't be drawn."
+            )
+        outputs += [distribution.logits, distribution.concentration]
+        data[name] = distribution.n.eval(), distribution.mask.eval()
+
+    free_names = [
+        pm.util.get_untransformed_name(var.name)
+        if pm.util.is_transformed_name(var.name)
+        else var.name
+        for var in model.free_RVs
+    ]
+    fn = draws_function([model[name] for name in free_names], outputs)
+
+    shape = (posterior.sizes["chain"], posterior.sizes["draw"])
+    results = {}
+    seeds = np.random.SeedSequence(random_seed)
+
+    def store(name, chain, draws, values):
+        if name not in results:
+            results[name] = np.empty(shape + values.shape[1:], dtype=values.dtype)
+        results[name][chain, draws] = values
+
+    pool = ProcessPoolExecutor(processes) if processes else contextlib.nullcontext()
+    # the chunks being drawn in the pool, at most two per process so that
+    # their parameters don't pile up in memory
+    pending = deque()
+    with pool as executor:
+        for chain, draws, values in iter_draws(fn, posterior, free_names, chunk_draws):
+            for name in var_names:
+                i = positions[name]
+                if name not in data:
+                    store(name, chain, draws, values[i])
+                    continue
+                args = (seeds.spawn(1)[0], values[i], values[i + 1]) + data[name]
+                if executor is None:
+                    store(name, chain, draws, _dirichlet_multinomial_chunk(*args))
+                    continue
+                future = executor.submit(_dirichlet_multinomial_chunk, *args)
+                pending.append((name, chain, draws, future))
+                if len(pending) > 2 * processes:
+                    *key, future = pending.popleft()
+                    store(*key, future.result())
+        for name, chain, draws, future in pending:
+            store(name, chain, draws, future.result())
+
+    return results
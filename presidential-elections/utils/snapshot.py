@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+"""
+Columnar on-disk snapshots of prepared pandas objects.
+
+A snapshot is a directory holding one ``.npy`` file per column and a
+``meta.json`` describing how to rebuild the frames. ``.npy`` files can be
+memory-mapped, so that loading a snapshot costs a few ``open`` calls and
+processes reading the same snapshot share the pages of the OS cache.
+"""
+
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_key(**params) -> str:
+    """Hash of everything that determines the content of a snapshot."""
+    params = {"version": SNAPSHOT_VERSION} | params
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()[:20]
+
+
+def _encode_column(values: pd.Series) -> Tuple[np.ndarray, Dict]:
+    dtype = values.dtype
+    if isinstance(dtype, pd.PeriodDtype):
+        return values.array.asi8, {"kind": "period", "freq": dtype.freq.freqstr}
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories, meta = _encode_column(pd.Series(dtype.categories))
+        return values.cat.codes.to_numpy(), {
+            "kind": "category",
+            "ordered": bool(dtype.ordered),
+            "categories": categories.tolist(),
+            "categories_meta": meta,
+        }
+    if np.issubdtype(dtype, np.datetime64):
+        return values.to_numpy().view(np.int64), {
+            "kind": "datetime",
+            "dtype": str(dtype),
+        }
+    if dtype == object:
+        if values.isna().any():
+            raise TypeError(f"Column {values.name} holds missing Python objects.")
+        return values.to_numpy().astype(str), {"kind": "str"}
+    return values.to_numpy(), {"kind": "native"}
+
+
+def _decode_column(
+    values: np.ndarray, meta: Dict
+) -> Union[np.ndarray, pd.api.extensions.ExtensionArray]:
+    if meta["kind"] == "period":
+        return pd.arrays.PeriodArray(
+            np.asarray(values), dtype=pd.PeriodDtype(meta["freq"])
+        )
+    if meta["kind"] == "category":
+        categories = _decode_column(
+            np.asarray(meta["categories"]), meta["categories_meta"]
+        )
+        return pd.Categorical.from_codes(
+            values, categories=categories, ordered=meta["ordered"]
+        )
+    if meta["kind"] == "datetime":
+        return np.asarray(values).view(meta["dtype"])
+    if meta["kind"] == "str":
+        return np.asarray(values).astype(object)
+    return values
+
+
+def save_snapshot(
+    path: Union[str, Path],
+    frames: Dict[str, Union[pd.DataFrame, pd.Index]],
+    attrs: Dict = None,
+):
+    """
+    Save pandas objects as a columnar snapshot.
+
+    Parameters
+    ----------
+    path
+        Directory of the snapshot. It is written next to its final location and
+        moved there in one step, so concurrent readers never see it half-written.
+    frames
+        The DataFrames and Indexes to save, by name. Index levels are saved as
+        regular columns and restored on load.
+    attrs
+        JSON-serializable metadata stored along the frames.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    meta = {"version": SNAPSHOT_VERSION, "attrs": attrs or {}, "frames": {}}
+    for name, obj in frames.items():
+        is_index = isinstance(obj, pd.Index)
+        frame = obj.to_frame(index=False) if is_index else obj
+        index_names = None if is_index else [str(n) for n in frame.index.names]
+        if not is_index:
+            frame = frame.reset_index()
+            frame.columns = index_names + [
+                str(c) for c in frame.columns[len(index_names) :]
+            ]
+
+        columns = []
+        for i, col in enumerate(frame.columns):
+            values, col_meta = _encode_column(frame.iloc[:, i])
+            np.save(
+                tmp / f"{name}.{i}.npy",
+                np.ascontiguousarray(values),
+                allow_pickle=False,
+            )
+            columns.append({"name": str(col)} | col_meta)
+        meta["frames"][name] = {
+            "columns": columns,
+            "index": index_names,
+            "is_index": is_index,
+            "name": obj.name if is_index else None,
+        }
+
+    (tmp / "meta.json").write_text(json.dumps(meta))
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # another process already wrote the same snapshot
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_snapshot(
+    path: Union[str, Path], mmap: bool = True
+) -> Tuple[Dict[str, Union[pd.DataFrame, pd.Index]], Dict]:
+    """
+    Load the frames and attributes of a snapshot written by ``save_snapshot``.
+
+    Parameters
+    ----------
+    path
+        Directory of the snapshot.
+    mmap
+        Memory-map the numeric columns instead of reading them in memory.
+    """
+    path = Path(path)
+    meta = json.loads((path / "meta.json").read_text())
+    if meta["version"] != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Snapshot at {path} has version {meta['version']}, expected {SNAPSHOT_VERSION}."
+        )
+
+    frames = {}
+    for name, frame_meta in meta["frames"].items():
+        data = {}
+        for i, col_meta in enumerate(frame_meta["columns"]):
+            values = np.load(
+                path / f"{name}.{i}.npy",
+                mmap_mode="r" if mmap else None,
+                allow_pickle=False,
+            )
+            data[col_meta["name"]] = _decode_column(values, col_meta)
+
+        if frame_meta["is_index"]:
+            frames[name] = (
+                pd.Index(next(iter(data.values())), name=frame_meta["name"])
+                if len(data) == 1
+                else pd.MultiIndex.from_frame(pd.DataFrame(data, copy=False))
+            )
+            continue
+
+        # the index is built from its columns and the frame around the other
+        # columns, as ``set_index`` would copy them out of the memory maps
+        names = frame_meta["index"]
+        levels = [data.pop(n) for n in names]
+        names = [None if n == "None" else n for n in names]
+        index = (
+            pd.Index(levels[0], name=names[0])
+            if len(levels) == 1
+            else pd.MultiIndex.from_arrays(levels, names=names)
+        )
+        frames[name] = pd.DataFrame(data, index=index, copy=False)
+
+    return frames, meta["attrs"]
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+from utils._lazy import LazyModule
+
+arviz = LazyModule("arviz")
+pm = LazyModule("pymc3")
+xr = LazyModule("xarray")
+
+"""
+Warm start of NUTS from the trace of a previous run on (almost) the same data.
+
+NUTS spends most of its tuning finding a step size, a mass matrix and a region
+of high posterior density, which barely move from one day's dataset to the
+next. The previous run holds all three: its final step sizes are in its
+sampler statistics, its posterior variances in the free (transformed) space
+are what the mass matrix adaptation estimates, and its last draws are good
+initial points.
+
+The previous posterior is mapped onto the coordinates of the new model by
+label, so that new pollsters, or a longer campaign, only add values. These
+values start at the mean over the other labels along the new dimension, which
+is 0 for the zero-sum variables, and get the median variance of their
+variable.
+
+``adaptation_state`` extracts what is needed from a trace into a small
+``InferenceData``, with only the free variables, which can be saved with
+``to_netcdf`` and passed instead of the full trace.
+"""
+
+
+def _free_names(model: pm.Model) -> List[str]:
+    """Names of the free variables of ``model``, as they are in a trace."""
+    return [
+        pm.util.get_untransformed_name(rv.name)
+        if pm.util.is_transformed_name(rv.name)
+        else rv.name
+        for rv in model.free_RVs
+    ]
+
+
+def adaptation_state(
+    idata: arviz.InferenceData, draws: int = 200, model: pm.Model = None
+) -> arviz.InferenceData:
+    """
+    The last ``draws`` draws of each chain of the free variables of ``model``,
+    which defaults to the model in context, and the step sizes of a trace.
+    """
+    names = _free_names(pm.modelcontext(model))
+    tail = {"draw": slice(-draws, None)}
+    groups = {"posterior": idata.posterior[names].isel(tail)}
+    if "sample_stats" in idata.groups() and "step_size" in idata.sample_stats:
+        groups["sample_stats"] = idata.sample_stats[["step_size"]].isel(tail)
+    return arviz.InferenceData(**groups)
+
+
+def load_adaptation_state(
+    state: Union[arviz.InferenceData, str, Path]
+) -> arviz.InferenceData:
+    if isinstance(state, (str, Path)):
+        return arviz.from_netcdf(str(state))
+    return state
+
+
+def _on_model_coords(
+    values: xr.DataArray, model: pm.Model, name: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Draws of the untransformed variable ``name`` as a ``(chain, draw, ...)``
+    array on the coordinates of ``model``, and which of its values are at
+    labels that are not in the trace. These get the mean over the other labels.
+    """
+    dims = model.RV_dims.get(name, ())
+    added = xr.zeros_like(values.isel(chain=0, draw=0, drop=True), dtype=bool)
+    for dim in dims:
+        if dim not in values.dims or dim not in model.coords:
+            continue
+        new = values.reindex({dim: model.coords[dim]})
+        values = new.fillna(values.mean(dim))
+        added = added.reindex({dim: model.coords[dim]}, fill_value=True)
+    return (
+        values.transpose("chain", "draw", *dims).to_numpy(),
+        added.transpose(*dims).to_numpy(),
+    )
+
+
+def _free_values(
+    model: pm.Model, state: arviz.InferenceData
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Draws of each free variable of ``model``, as ``(chain, draw, ...)``
+    arrays, and which of their values are at labels added by the model.
+    """
+    free, added = {}, {}
+    for rv, name in zip(model.free_RVs, _free_names(model)):
+        values, is_added = _on_model_coords(state.posterior[name], model, name)
+
+        distribution = model[name].distribution
+        for axis in getattr(distribution, "zerosum_axes", ()):
+            # the mean over the added labels breaks the constraint slightly
+            values = values - values.mean(axis=2 + axis, keepdims=True)
+        if name != rv.name:
+            forward = model[name].transformation.forward_val
+            values = np.stack(
+                [
+                    np.stack([forward(draw) for draw in chain], axis=0)
+                    for chain in values
+                ],
+                axis=0,
+            )
+            # the other transforms are elementwise, whereas the zero-sum one
+            # drops the last value along its axes
+            for axis in getattr(distribution, "zerosum_axes", ()):
+                is_added = np.delete(is_added, -1, axis=axis)
+        free[rv.name] = values.reshape(values.shape[:2] + tuple(rv.dshape))
+        added[rv.name] = is_added.reshape(tuple(rv.dshape))
+    return free, added
+
+
+def _variance_fill(
+    variance: np.ndarray, added: np.ndarray, sizes: List[int]
+) -> np.ndarray:
+    """
+    Replace the variances of the ``added`` values, which are much smaller than
+    those of the others as they are averages, by the median variance of the
+    other values of their variable.
+    """
+    start = 0
+    for size in sizes:
+        block = slice(start, start + size)
+        kept = variance[block][~added[block]]
+        if len(kept):
+            variance[block][added[block]] = np.median(kept)
+        start += size
+    return variance
+
+
+def warm_start(
+    model: pm.Model,
+    state: Union[arviz.InferenceData, str, Path],
+    chains: int,
+    dense_mass: bool = False,
+    initial_weight: int = 10,
+    target_accept: float = 0.8,
+) -> Tuple[pm.step_methods.NUTS, List[Dict[str, np.ndarray]]]:
+    """
+    NUTS step and initial points for ``chains`` chains of ``model``, from the
+    state of a previous run.
+
+    Parameters
+    ----------
+    model
+        The model to sample.
+    state
+        The trace of the previous run, its ``adaptation_state``, or the path of
+        a saved ``adaptation_state``.
+    chains
+        Number of chains. The initial point of each is the last draw of a
+        chain of the previous run, in turn.
+    dense_mass
+        Estimate a dense mass matrix from the previous draws, instead of a
+        diagonal one.
+    initial_weight
+        How many draws the previous estimate of the mass matrix counts for,
+        as the adaptation goes on during tuning.
+    target_accept
+        Target acceptance rate of the step size adaptation.
+    """
+    state = load_adaptation_state(state)
+    free, added = _free_values(model, state)
+    ordering = pm.blocking.ArrayOrdering(model.free_RVs)
+    # the draws as a ``(chain, draw, parameters)`` array in the sampler's order
+    flat = np.concatenate(
+        [
+            free[vmap.var].reshape(free[vmap.var].shape[:2] + (-1,))
+            for vmap in ordering.vmap
+        ],
+        axis=-1,
+    )
+    n_chains, n_draws, n = flat.shape
+    samples = flat.reshape(n_chains * n_draws, n)
+    mean = samples.mean(axis=0)
+    sizes = [vmap.slc.stop - vmap.slc.start for vmap in ordering.vmap]
+    added = np.concatenate([added[vmap.var].ravel() for vmap in ordering.vmap])
+
+    quadpotential = pm.step_methods.hmc.quadpotential
+    if dense_mass:
+        cov = np.cov(samples, rowvar=False)
+        # the added values are averages of the others: only keep their variance
+        variance = _variance_fill(np.diag(cov).copy(), added, sizes)
+        cov[added, :] = 0
+        cov[:, added] = 0
+        cov[np.diag_indices(n)] = variance
+        potential = quadpotential.QuadPotentialFullAdapt(
+            n, mean, cov, initial_weight
+        )
+    else:
+        potential = quadpotential.QuadPotentialDiagAdapt(
+            n, mean, _variance_fill(samples.var(axis=0), added, sizes), initial_weight
+        )
+
+    if "sample_stats" in state.groups() and "step_size" in state.sample_stats:
+        step_size = float(state.sample_stats["step_size"].isel(draw=-1).mean())
+    else:
+        step_size = 0.25
+    # NUTS starts from ``step_scale / n ** (1 / 4)``
+    step = pm.NUTS(
+        model.free_RVs,
+        model=model,
+        potential=potential,
+        step_scale=step_size * n ** 0.25,
+        target_accept=target_accept,
+    )
+
+    start = [
+        {var: values[chain % n_chains, -1] for var, values in free.items()}
+        for chain in range(chains)
+    ]
+    return step, start
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+from copy import copy
+from pathlib import Path
+from typing import Dict, List, Union
+
+import numpy as np
+import pymc3 as pm
+from utils._lazy import LazyModule
+
+arviz = LazyModule("arviz")
+xr = LazyModule("xarray")
+zarr = LazyModule("zarr")
+
+"""
+Trace backend streaming the draws of ``pm.sample`` to a chunked zarr store.
+
+The default backend keeps every draw of every chain in memory, including the
+deterministics with one value per observation, until the sampling is over and
+the whole trace is converted to ``InferenceData``. ``ZarrTrace`` instead
+buffers ``chunk_draws`` draws per chain and appends them to the store, which
+compresses each chunk, so that the memory used by the trace doesn't grow with
+the number of draws.
+
+The store follows xarray's zarr conventions, with one group per
+``InferenceData`` group, so ``open_trace`` opens it lazily, as dask arrays.
+
+Requires ``zarr`` and ``dask``.
+"""
+
+# names of the sampler statistics in ``InferenceData``, as ``arviz.from_pymc3``
+STATS_NAMES = {
+    "model_logp": "lp",
+    "mean_tree_accept": "acceptance_rate",
+    "depth": "tree_depth",
+    "tree_size": "n_steps",
+}
+
+
+class ZarrTrace(pm.backends.base.BaseTrace):
+    """Backend writing the draws of one chain to a zarr store.
+
+    Parameters
+    ----------
+    path
+        Directory of the store, shared by all the chains.
+    chain
+        Index of the chain.
+    first_chain
+        Index of the first chain of the store, which is its first row along
+        the chains, as ``chain_idx`` in ``pm.sample``.
+    chunk_draws
+        Number of draws kept in memory before they are written, and size of
+        the chunks along the draws.
+    model
+        The model sampled.
+    vars
+        The variables to record. Defaults to the variables of the model, but
+        not their transformed values, as ``arviz.from_pymc3``.
+    """
+
+    supports_sampler_stats = True
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        chain: int,
+        first_chain: int = 0,
+        chunk_draws: int = 100,
+        model: pm.Model = None,
+        vars: List = None,
+        test_point: Dict = None,
+    ):
+        model = pm.modelcontext(model)
+        if vars is None:
+            vars = [
+                var
+                for var in model.unobserved_RVs
+                if not pm.util.is_transformed_name(var.name)
+            ]
+        super().__init__(str(path), model=model, vars=vars, test_point=test_point)
+        self.path = Path(path)
+        self.chain = chain
+        self.first_chain = first_chain
+        self.chunk_draws = chunk_draws
+        self._view = None
+        self.draw_idx = 0
+
+    def setup(self, draws: int, chain: int, sampler_vars: List[Dict] = None):
+        super().setup(draws, chain, sampler_vars)
+        if chain < self.first_chain:
+            raise ValueError(
+                f"Chain {chain} is before the first chain {self.first_chain} "
+                "of the store."
+            )
+        self.chain = chain
+        self.draw_idx = self._written = 0
+        root = zarr.open_group(str(self.path), mode="a")
+
+        self._arrays = {}
+        for name in self.varnames:
+            self._arrays[name] = self._require_array(
+                root.require_group("posterior"),
+                name,
+                draws,
+                self.var_shapes[name],
+                self.var_dtypes[name],
+                self._dims(name, len(self.var_shapes[name])),
+            )
+
+        # statistics by sampler, under a name suffixed with the index of the
+        # sampler when several samplers have it
+        self._stats = {}
+        counts = {}
+        for stats in sampler_vars or []:
+            for stat in stats:
+                counts[stat] = counts.get(stat, 0) + 1
+        for sampler_idx, stats in enumerate(sampler_vars or []):
+            for stat, dtype in stats.items():
+                if np.dtype(dtype).kind == "O":
+                    continue
+                key = STATS_NAMES.get(stat, stat)
+                if counts[stat] > 1:
+                    key = f"{key}_{sampler_idx}"
+                self._stats[sampler_idx, stat] = key
+                self._arrays[key] = self._require_array(
+                    root.require_group("sample_stats"), key, draws, (), dtype, ()
+                )
+
+        self._buffers = {
+            key: np.empty((self.chunk_draws,) + array.shape[2:], dtype=array.dtype)
+            for key, array in self._arrays.items()
+        }
+
+    @property
+    def _row(self) -> int:
+        """Position of the chain along the chains of the store."""
+        return self.chain - self.first_chain
+
+    def _dims(self, name: str, ndim: int) -> List[str]:
+        dims = self.model.RV_dims.get(name)
+        if dims is None or len(dims) != ndim:
+            dims = [f"{name}_dim_{i}" for i in range(ndim)]
+        return list(dims)
+
+    def _require_array(self, group, name, draws, shape, dtype, dims):
+        """
+        The ``(chain, draw, *shape)`` array ``name`` of ``group``, grown to hold
+        this chain, with the coordinates of its dimensions.
+        """
+        n_chains = self._row + 1
+        if name in group:
+            array = group[name]
+            if array.shape[0] < n_chains:
+                array.resize((n_chains,) + array.shape[1:])
+        else:
+            array = group.create_dataset(
+                name,
+                shape=(n_chains, draws) + tuple(shape),
+                chunks=(1, self.chunk_draws) + tuple(shape),
+                dtype=dtype,
+                fill_value=None,
+            )
+            array.attrs["_ARRAY_DIMENSIONS"] = ["chain", "draw"] + list(dims)
+
+        coords = {
+            "chain": self.first_chain + np.arange(array.shape[0]),
+            "draw": np.arange(draws),
+        }
+        for dim in dims:
+            if dim not in group and dim in self.model.coords:
+                coords[dim] = np.asarray(self.model.coords[dim])
+        for dim, values in coords.items():
+            if values.dtype.kind == "O":
+                values = values.astype(str)
+            if dim not in group or group[dim].shape != values.shape:
+                group.array(dim, data=values, overwrite=True, fill_value=None)
+                group[dim].attrs["_ARRAY_DIMENSIONS"] = [dim]
+        return array
+
+    def record(self, point: Dict, sampler_stats: List[Dict] = None):
+        i = self.draw_idx - self._written
+        for name, value in zip(self.varnames, self.fn(point)):
+            self._buffers[name][i] = value
+        for (sampler_idx, stat), key in self._stats.items():
+            self._buffers[key][i] = sampler_stats[sampler_idx][stat]
+        self.draw_idx += 1
+        if self.draw_idx - self._written == self.chunk_draws:
+            self._flush()
+
+    def _flush(self):
+        n = self.draw_idx - self._written
+        if n == 0:
+            return
+        for key, array in self._arrays.items():
+            array[self._row, self._written : self.draw_idx] = self._buffers[key][:n]
+        self._written = self.draw_idx
+
+    def close(self):
+        self._flush()
+
+    def _indices(self) -> range:
+        return range(self.draw_idx) if self._view is None else self._view
+
+    def __len__(self):
+        return len(self._indices())
+
+    def _read(self, key: str, idx: Union[range, int]) -> np.ndarray:
+        self._flush()
+        if isinstance(idx, range):
+            idx = slice(idx.start, idx.stop, idx.step)
+        return self._arrays[key][self._row, idx]
+
+    def get_values(self, varname: str, burn: int = 0, thin: int = 1) -> np.ndarray:
+        return self._read(varname, self._indices()[burn::thin])
+
+    def _slice(self, idx: slice) -> "ZarrTrace":
+        sliced = copy(self)
+        sliced._view = self._indices()[idx]
+        return sliced
+
+    def point(self, idx: int) -> Dict[str, np.ndarray]:
+        draw = self._indices()[idx]
+        return {name: self._read(name, draw) for name in self.varnames}
+
+    def _get_sampler_stats(
+        self, stat_name: str, sampler_idx: int, burn: int, thin: int
+    ) -> np.ndarray:
+        return self._read(
+            self._stats[sampler_idx, stat_name], self._indices()[burn::thin]
+        )
+
+
+def zarr_traces(
+    path: Union[str, Path],
+    chains: int,
+    chain_idx: int = 0,
+    chunk_draws: int = 100,
+    model: pm.Model = None,
+) -> pm.backends.base.MultiTrace:
+    """
+    One ``ZarrTrace`` per chain, as the ``trace`` argument of ``pm.sample``,
+    which takes each chain's backend from it. The chains are numbered from
+    ``chain_idx``, as in ``pm.sample``, and stored from the first row. ``path``
+    must not hold a trace already.
+    """
+    if Path(path).exists() and any(Path(path).iterdir()):
+        raise FileExistsError(f"{path} is not empty: pick a new trace store.")
+    return pm.backends.base.MultiTrace(
+        [
+            ZarrTrace(
+                path,
+                chain,
+                first_chain=chain_idx,
+                chunk_draws=chunk_draws,
+                model=model,
+            )
+            for chain in range(chain_idx, chain_idx + chains)
+        ]
+    )
+
+
+def open_trace(path: Union[str, Path], tune: int = 0) -> arviz.InferenceData:
+    """
+    Open the store written by ``ZarrTrace`` lazily, as an ``InferenceData``
+    backed by dask arrays, without its first ``tune`` draws.
+    """
+    groups = {}
+    for group in ("posterior", "sample_stats"):
+        dataset = xr.open_zarr(str(path), group=group, consolidated=False)
+        dataset = dataset.isel(draw=slice(tune, None))
+        groups[group] = dataset.assign_coords(draw=np.arange(dataset.sizes["draw"]))
+    return arviz.InferenceData(**groups)